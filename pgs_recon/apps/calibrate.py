@@ -45,6 +45,7 @@ name.
 import atexit
 import json
 import logging
+import shlex
 import shutil
 import sys
 from datetime import datetime as dt, timezone as tz
@@ -297,7 +298,7 @@ def build_single_intrinsic_scene(sfm_path: Path, query_w: int, query_h: int,
         '-V', '-I', '-E', '-S', '-C',
     ]
     if metadata is not None:
-        metadata['commands'][current_timestamp()] = ' '.join(command)
+        metadata['commands'][current_timestamp()] = shlex.join(command)
     run_command(command)
 
     data = json.loads(full.read_text())
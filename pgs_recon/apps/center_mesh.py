@@ -1,82 +1,148 @@
 import argparse
-import random
+import math
 import sys
-from itertools import combinations
 from pathlib import Path
 
 import cv2
 import numpy as np
-from vtkmodules.vtkCommonCore import mutable, vtkPoints
-from vtkmodules.vtkCommonDataModel import vtkCellArray, vtkPolyData, vtkPolygon
-from vtkmodules.vtkCommonTransforms import vtkTransform
-from vtkmodules.vtkFiltersCore import vtkTriangleMeshPointNormals
-from vtkmodules.vtkFiltersGeneral import vtkOBBTree, vtkTransformPolyDataFilter
+import trimesh
+from scipy.spatial.distance import pdist
+from vtkmodules.util.numpy_support import numpy_to_vtk, vtk_to_numpy
+from vtkmodules.vtkFiltersGeneral import vtkOBBTree
 
 import pgs_recon.utils.educelab as el
 from pgs_recon.utils import wavefront as wobj
+from pgs_recon.utils.images import IMREAD_REDUCED
+
+
+# 2D point location in a mesh's UV map. The UV triangles are binned into a
+# uniform grid by their bounding boxes, so locating a UV coordinate only tests
+# the triangles binned into its grid cell. All lookups are batched.
+class UVLookup:
+    # barycentric tolerance for points on a triangle's edges
+    tolerance = 1e-7
+
+    def __init__(self, uvs, faces):
+        # Nx3x2 array of UV triangles
+        self.tris = np.asarray(uvs, dtype=np.float64)[:, :2][faces]
+        num_tris = self.tris.shape[0]
+        lo = self.tris.min(axis=1)
+        hi = self.tris.max(axis=1)
+
+        # ~1 triangle per cell for a uniform UV map
+        self.dim = int(np.clip(np.ceil(np.sqrt(num_tris)), 1, 2048))
+        self.origin = lo.min(axis=0)
+        extent = np.maximum(hi.max(axis=0) - self.origin, np.finfo(float).eps)
+        self.cell_size = extent / self.dim
+
+        # Range of grid cells covered by each triangle's bounding box
+        c_lo = self._cell(lo)
+        c_hi = self._cell(hi)
+        span = c_hi - c_lo + 1
+        counts = span.prod(axis=1)
+
+        # Expand to one (cell, triangle) entry per covered cell
+        tri_ids = np.repeat(np.arange(num_tris), counts)
+        local = np.arange(tri_ids.shape[0]) - np.repeat(
+            np.cumsum(counts) - counts, counts)
+        cx = c_lo[tri_ids, 0] + local % span[tri_ids, 0]
+        cy = c_lo[tri_ids, 1] + local // span[tri_ids, 0]
+        cell_ids = cy * self.dim + cx
+
+        # Sort the entries by cell
+        order = np.argsort(cell_ids, kind='stable')
+        self.cell_tris = tri_ids[order]
+        self.cell_start = np.zeros(self.dim * self.dim + 1, dtype=np.intp)
+        np.cumsum(np.bincount(cell_ids, minlength=self.dim * self.dim),
+                  out=self.cell_start[1:])
+
+    def _cell(self, pts):
+        c = np.floor((pts - self.origin) / self.cell_size).astype(np.intp)
+        return np.clip(c, 0, self.dim - 1)
+
+    # Find the triangles containing each of the Nx2 uv_pts
+    # Returns the index of the containing triangle, the Nx3 barycentric
+    # coordinate of each point in that triangle, and an N-length boolean array
+    # which is True for each point that lies in the UV map
+    def find(self, uv_pts):
+        uv_pts = np.asarray(uv_pts, dtype=np.float64).reshape(-1, 2)
+        num_pts = uv_pts.shape[0]
+        tri_ids = np.zeros(num_pts, dtype=np.intp)
+        bary = np.zeros((num_pts, 3))
+        hits = np.zeros(num_pts, dtype=bool)
+
+        # Candidate triangles for each point
+        cells = self._cell(uv_pts)
+        cells = cells[:, 1] * self.dim + cells[:, 0]
+        start = self.cell_start[cells]
+        counts = self.cell_start[cells + 1] - start
+        pt_ids = np.repeat(np.arange(num_pts), counts)
+        local = np.arange(pt_ids.shape[0]) - np.repeat(
+            np.cumsum(counts) - counts, counts)
+        cands = self.cell_tris[start[pt_ids] + local]
+
+        # Barycentric coordinates of each point in its candidate triangles
+        a, b, c = np.moveaxis(self.tris[cands], 1, 0)
+        v0 = b - a
+        v1 = c - a
+        v2 = uv_pts[pt_ids] - a
+        d00 = np.einsum('ij,ij->i', v0, v0)
+        d01 = np.einsum('ij,ij->i', v0, v1)
+        d11 = np.einsum('ij,ij->i', v1, v1)
+        d20 = np.einsum('ij,ij->i', v2, v0)
+        d21 = np.einsum('ij,ij->i', v2, v1)
+        denom = d00 * d11 - d01 * d01
+        with np.errstate(divide='ignore', invalid='ignore'):
+            v = (d11 * d20 - d01 * d21) / denom
+            w = (d00 * d21 - d01 * d20) / denom
+        cand_bary = np.column_stack([1. - v - w, v, w])
+
+        # Keep the first candidate which contains each point
+        inside = np.all(cand_bary >= -self.tolerance, axis=1)
+        inside = np.flatnonzero(inside)
+        found, first = np.unique(pt_ids[inside], return_index=True)
+        tri_ids[found] = cands[inside[first]]
+        bary[found] = cand_bary[inside[first]]
+        hits[found] = True
+        return tri_ids, bary, hits
+
+
+# convert WavefrontOBJ.polygons to an Fx3x3 array of (vid, tid, nid) triangles.
+# Polygons with more than 3 vertices are fan triangulated and missing texture or
+# normal indices are set to -1.
+def polygons_to_array(polygons) -> np.ndarray:
+    if any(len(p) != 3 for p in polygons):
+        polygons = [(p[0], p[i - 1], p[i])
+                    for p in polygons for i in range(2, len(p))]
+    try:
+        return np.array(polygons, dtype=np.intp).reshape(-1, 3, 3)
+    except TypeError:
+        polys = np.array(polygons, dtype=object).reshape(-1, 3, 3)
+        polys[polys == None] = -1  # noqa: E711
+        return polys.astype(np.intp)
+
+
+# given an array of UV coordinates, find their corresponding 3D points on the
+# mesh
+# uv_lookup: UVLookup built from the mesh's UV map
+# uv_pts: an Nx2 array of UV coordinates to lookup
+# verts: Vx3 array of mesh vertices
+# vids: Fx3 array of vertex indices for each face, in the same face order as
+# uv_lookup
+# Returns an Nx3 array of 3D points and an N-length boolean array which is True
+# for each UV coordinate that lies in the UV map. Points for UV coordinates
+# which do not lie in the UV map are set to NaN.
+def lookup_uvs_to_3d(uv_lookup, uv_pts, verts, vids):
+    tri_ids, bary, hits = uv_lookup.find(uv_pts)
+    pts = np.full((hits.shape[0], 3), np.nan)
+
+    # Interpolate the 3D position of every hit from its triangle's vertices
+    tri_verts = verts[vids[tri_ids[hits]]]
+    pts[hits] = np.einsum('ni,nij->nj', bary[hits], tri_verts)
+
+    return pts, hits
 
 
-# convert a list of vertices and polygons (output from a WavefrontOBJ) to a
-# vtkPolyData. Similar to wavefront.mesh_to_polydata(), but pid determines
-# which polygon property to use for cell creation:
-# 0 = vertex
-# 1 = uv coordinate
-# 2 = vertex normal
-def mesh_from_obj_props(verts, polys, pid):
-    polydata = vtkPolyData()
-
-    # vertices
-    pts = vtkPoints()
-    for v in verts:
-        pts.InsertNextPoint(v)
-    polydata.SetPoints(pts)
-
-    # faces
-    cells = vtkCellArray()
-    for p in polys:
-        poly = vtkPolygon()
-        for v in p:
-            poly.GetPointIds().InsertNextId(v[pid])
-        cells.InsertNextCell(poly)
-    polydata.SetPolys(cells)
-    return polydata
-
-
-# calculate a 3D point on a triangle from a barycentric coordinate and the
-# triangle's three vertices
-def interpolate_on_tri(bary, a, b, c):
-    x = bary[0] * a[0] + bary[1] * b[0] + bary[2] * c[0]
-    y = bary[0] * a[1] + bary[1] * b[1] + bary[2] * c[1]
-    z = bary[0] * a[2] + bary[1] * b[2] + bary[2] * c[2]
-    return np.array([x, y, z])
-
-
-# given a UV coordinate, find its corresponding 3D point on the mesh
-# uv_tree: vtkOBBTree built with a meshed version of the UV map
-# uv_pt: the UV coordinate to lookup
-# mesh: a mesh of type WavefrontOBJ
-def lookup_uv_to_3d(uv_tree, uv_pt, mesh):
-    # Inputs
-    p1 = [uv_pt[0], uv_pt[1], -1.0]
-    p2 = [uv_pt[0], uv_pt[1], 1.0]
-    tolerance = 0.001
-
-    # Outputs
-    t = mutable(0)
-    x = [0.0, 0.0, 0.0]
-    params = [0.0, 0.0, 0.0]
-    s_id = mutable(0)
-    c_id = mutable(0)
-    res = uv_tree.IntersectWithLine(p1, p2, tolerance, t, x, params, s_id, c_id)
-
-    if res > 0:
-        bary = [1 - params[0] - params[1], params[0], params[1]]
-        a, b, c = [mesh.vertices[c[0]] for c in mesh.polygons[c_id]]
-        x = interpolate_on_tri(bary, a, b, c)
-        return x
-    else:
-        return None
-
 # Default align_vector tolerance
 _ALIGN_ATOL = 2e-3
 
@@ -88,43 +154,49 @@ def align_vector(a, b, c, atol=_ALIGN_ATOL):
     r = np.eye(3)
 
     # First, check for anti-parallel vectors
-    if np.isclose(a.dot(b), -1., atol=atol):
+    if math.isclose(a.dot(b), -1., rel_tol=1e-5, abs_tol=atol):
         d = np.copysign((1., 1., 1.), np.abs(c) - 1)
         r = np.diagflat(d)
 
     # Next, return early for parallel vectors
     a = r @ a
-    if np.isclose(a.dot(b), 1., atol=atol):
+    if math.isclose(a.dot(b), 1., rel_tol=1e-5, abs_tol=atol):
         return r
 
     # Finally, refine the rotation with a special form of Rodriguez rotation
     # https://math.stackexchange.com/a/476311
+    # Uses the identity vx @ vx == outer(v, v) - (v . v) * I
     v = np.cross(a, b)
     c = np.dot(a, b)
     vx = np.array([[0, -v[2], v[1]],
                    [v[2], 0, -v[0]],
                    [-v[1], v[0], 0]])
-    rod = np.eye(3) + vx + np.dot(vx, vx) / (1 + c)
+    vx2 = np.outer(v, v) - v.dot(v) * np.eye(3)
+    rod = np.eye(3) + vx + vx2 / (1 + c)
     return rod @ r
 
 
 # Find the closest vector to v in vs
 # If result is anti-parallel to v, it will be flipped
 def find_closest_vector(v, vs):
-    dots = [np.dot(el.unit_vec(v), el.unit_vec(e)) for e in vs]
+    vs = np.asarray(vs, dtype=np.float64)
+    vs = vs / np.linalg.norm(vs, axis=1, keepdims=True)
+    dots = vs @ el.unit_vec(v)
     edge_idx = np.argmax(np.abs(dots))
-    v = el.unit_vec(vs[edge_idx])
+    v = vs[edge_idx]
     if dots[edge_idx] < 0:
-        v *= -1
+        v = -v
     return v
 
 
 # Orient and center the mesh using its oriented bounding box and surface normals
-def bounding_box_calibration(polydata, max_edge, mid_edge, max_dir, mid_dir,
+# verts: Vx3 array of the mesh's vertices
+# faces: Fx3 array of vertex indices
+def bounding_box_calibration(verts, faces, max_edge, mid_edge, max_dir, mid_dir,
                              flip_max, flip_mid):
     # Get basis vectors
-    max_target = basis_vectors[max_dir]
-    mid_target = basis_vectors[mid_dir]
+    max_target = _BASIS[_DIR[max_dir]]
+    mid_target = _BASIS[_DIR[mid_dir]]
     min_target = 1 - (max_target + mid_target)
 
     # Align max edge to max target
@@ -135,24 +207,19 @@ def bounding_box_calibration(polydata, max_edge, mid_edge, max_dir, mid_dir,
     mid_target = flip_mid * mid_target
     r = align_vector(r @ el.unit_vec(mid_edge), mid_target, max_target) @ r
 
-    # Sample N normals
-    num_pts = polydata.GetNumberOfPoints()
-    num_samples = min(num_pts, 1000)
-    n_idxs = random.sample(range(polydata.GetNumberOfPoints()), num_samples)
-    normals = []
-    nrml_data = polydata.GetPointData().GetArray('Normals')
-    for idx in n_idxs:
-        normals.append(nrml_data.GetTuple(idx))
+    # Sample N face normals. Only their direction is voted on, so they are
+    # left unnormalized.
+    num_faces = faces.shape[0]
+    num_samples = min(num_faces, 1000)
+    rng = np.random.default_rng()
+    tris = verts[faces[rng.choice(num_faces, size=num_samples, replace=False)]]
+    normals = np.cross(tris[:, 1] - tris[:, 0], tris[:, 2] - tris[:, 0])
 
     # Update normals to their new rotated orientation
-    normals = np.array(normals)
-    normals = (r @ normals.T).T
+    normals = normals @ r.T
 
     # See how many samples are in the direction of min_target
-    s = 0
-    for n in normals:
-        v = np.dot(n, min_target)
-        s += 1 if v > 0 else 0
+    s = np.count_nonzero(normals @ min_target > 0)
 
     # If <= 40%, then rotate 180 degrees
     if s <= num_samples * 0.4:
@@ -166,11 +233,23 @@ def bounding_box_calibration(polydata, max_edge, mid_edge, max_dir, mid_dir,
 
 # automatically scale and orient a mesh by detecting the EL sample square
 # assumes the texture image has been reordered
-def sample_square_calibration(mesh, img, edges, compute_scale=True):
+# verts: Vx3 array of the mesh's vertices
+# polys: Fx3x3 array of the mesh's triangles (see polygons_to_array)
+# img: texture image used for detection. If reduction > 1, img was loaded at
+#   1/reduction resolution and the full resolution texture is reloaded from
+#   texture_path when the texture needs to be flipped or rotated
+def sample_square_calibration(mesh, verts, polys, img, edges,
+                              compute_scale=True, texture_path=None,
+                              reduction=1):
     # Defaults
     scale = np.eye(4, dtype=np.float32)
     r = np.eye(3, dtype=np.float32)
 
+    # The UV lookup needs texture coordinates for every face
+    if np.any(polys[:, :, 1] < 0):
+        print('Warning: Mesh faces are missing texture coordinates.')
+        return False, scale, r, None
+
     # Detect board
     print('Detecting EduceLab sample square...')
     detected, boards, ppcm, kp_ids, kp_pixels, flip, rotate = el.detect_sample_square(
@@ -187,48 +266,58 @@ def sample_square_calibration(mesh, img, edges, compute_scale=True):
     print(f'Detected:\n'
           f' - Markers: {num_markers}\n'
           f' - Board corners: {num_boards}\n'
-          f' - Texture resolution (pixels/cm): {ppcm}')
+          f' - Texture resolution (pixels/cm): {ppcm * reduction}')
+
+    # Normalizes detected pixel positions to UV coordinates. Key points are
+    # returned in the orientation of the flipped and rotated image.
+    px_max = np.array((img.shape[1] - 1, img.shape[0] - 1), dtype=np.float64)
+    if rotate in (cv2.ROTATE_90_CLOCKWISE, cv2.ROTATE_90_COUNTERCLOCKWISE):
+        px_max = px_max[::-1]
 
     # Flip the image and UV map if needed
     # OpenCV flip codes: 0 == vertical, 1 == horizontal
+    if flip is not None or rotate is not None:
+        uvs = np.array(mesh.texcoords, dtype=np.float64)[:, :2]
+        if reduction > 1:
+            print('Loading full resolution texture image...')
+            img = cv2.imread(str(texture_path))
     if flip is not None:
         print('Flipping image...')
         img = cv2.flip(img, flip)
-        for idx, uv in enumerate(mesh.texcoords):
-            u = 1. - uv[0] if flip == 1 else uv[0]
-            v = 1. - uv[1] if flip == 0 else uv[1]
-            mesh.texcoords[idx] = [u, v]
+        axis = 0 if flip == 1 else 1
+        uvs[:, axis] = 1. - uvs[:, axis]
+        mesh.texcoords = uvs
 
     # Rotate image
     if rotate is not None:
         msg = ['90°', '180°', '270°']
         print(f'Rotating image {msg[rotate]}...')
         img = cv2.rotate(img, rotate)
-        for idx, uv in enumerate(mesh.texcoords):
-            mesh.texcoords[idx] = el.rotate_kp(uv, (1., 1.), rotate).tolist()
+        mesh.texcoords = el.rotate_kp(uvs, (1., 1.), rotate)
 
-    # Convert UV map to polydata
-    print('Computing UV lookup tree...')
-    uvs = [[uv[0], uv[1], 0.] for uv in mesh.texcoords]
-    uv_tree = vtkOBBTree()
-    uv_tree.SetDataSet(mesh_from_obj_props(uvs, mesh.polygons, pid=1))
-    uv_tree.BuildLocator()
+    # Build UV map lookup
+    print('Computing UV lookup grid...')
+    vids = polys[:, :, 0]
+    uv_lookup = UVLookup(mesh.texcoords, polys[:, :, 1])
 
     # ORIENTATION
     if num_markers > 0:
         print('Calculating orientation...')
-        right_samples = []
-        down_samples = []
-        for b in boards:
-            for m in b.marker_corners:
-                pts = m[0] / [img.shape[1] - 1, img.shape[0] - 1]
-                pts = [lookup_uv_to_3d(uv_tree, uv, mesh) for uv in pts]
-                if not np.all(pts):
-                    continue
-                right_samples.append(el.unit_vec(pts[1] - pts[0]))
-                right_samples.append(el.unit_vec(pts[2] - pts[3]))
-                down_samples.append(el.unit_vec(pts[3] - pts[0]))
-                down_samples.append(el.unit_vec(pts[2] - pts[1]))
+        corners = [m[0] for b in boards for m in b.marker_corners]
+        uvs = np.concatenate(corners) / px_max
+        pts, hits = lookup_uvs_to_3d(uv_lookup, uvs, verts, vids)
+
+        # Skip markers with any corner outside the UV map
+        pts = pts.reshape(-1, 4, 3)
+        pts = pts[np.all(hits.reshape(-1, 4), axis=1)]
+
+        # Edge directions of each marker
+        right_samples = np.concatenate([pts[:, 1] - pts[:, 0],
+                                        pts[:, 2] - pts[:, 3]])
+        down_samples = np.concatenate([pts[:, 3] - pts[:, 0],
+                                       pts[:, 2] - pts[:, 1]])
+        right_samples /= np.linalg.norm(right_samples, axis=1, keepdims=True)
+        down_samples /= np.linalg.norm(down_samples, axis=1, keepdims=True)
 
         # Make sure we detected the UVs correctly
         if len(right_samples) == 0 and len(down_samples) == 0:
@@ -236,8 +325,8 @@ def sample_square_calibration(mesh, img, edges, compute_scale=True):
                   'lie in the UV map. Cannot calculate orientation.')
         else:
             # Rotation targets
-            right_target = basis_vectors['x']
-            down_target = -basis_vectors['y']
+            right_target = _BASIS[_DIR['x']]
+            down_target = -_BASIS[_DIR['y']]
 
             # Align right edge to X axis
             right = np.mean(right_samples, axis=0)
@@ -260,50 +349,36 @@ def sample_square_calibration(mesh, img, edges, compute_scale=True):
 
     print('Calculating scale...')
     # Convert pixels to 3D points
-    kp_pos = []
-    for p in kp_pixels:
-        uv = p / [img.shape[1] - 1, img.shape[0] - 1]
-        res = lookup_uv_to_3d(uv_tree, uv, mesh)
-        # Stop processing this box if no intersection
-        if res is None:
-            break
-        else:
-            kp_pos.append(res)
-    scale_samples = []
-    distances_expected = []
-    distances_measured = []
-    for ids, pts in zip(combinations(kp_ids, r=2),
-                        combinations(kp_pos, r=2)):
-        dist_cm = el.kp_dist(ids[0], ids[1])
-        dist_3d = np.linalg.norm(pts[1] - pts[0])
-        distances_expected.append(dist_cm)
-        distances_measured.append(dist_3d)
-        scale_samples.append(dist_cm / dist_3d)
+    uvs = np.reshape(kp_pixels, (-1, 2)) / px_max
+    kp_pos, kp_hits = lookup_uvs_to_3d(uv_lookup, uvs, verts, vids)
+    # Drop keypoints which don't lie in the UV map
+    kp_ids = np.asarray(kp_ids)[kp_hits]
+    kp_pos = kp_pos[kp_hits]
+    distances_expected = el.kp_dists(kp_ids)
+    distances_measured = pdist(kp_pos)
+    scale_samples = distances_expected / distances_measured
     scale_factor = np.mean(scale_samples)
     scale = np.eye(4, dtype=np.float32)
     np.fill_diagonal(scale[0:3, 0:3], scale_factor)
 
     # Measure error
-    errors = []
-    for expected, measured in zip(distances_expected, distances_measured):
-        errors.append(np.abs(measured * scale_factor - expected))
+    errors = np.abs(distances_measured * scale_factor - distances_expected)
 
     # Report results
+    err_min, err_med, err_max = np.percentile(errors, [0, 50, 100])
     print(f'Scale factor: {scale_factor:.7f}')
     print(f'Absolute error (cm):')
-    print(f' - Max: {np.max(errors):.7f}')
-    print(f' - Min: {np.min(errors):.7f}')
-    print(f' - Mean: {np.mean(errors):.7f}')
-    print(f' - Median: {np.median(errors):.7f}')
+    print(f' - Max: {err_max:.7f}')
+    print(f' - Min: {err_min:.7f}')
+    print(f' - Mean: {errors.mean():.7f}')
+    print(f' - Median: {err_med:.7f}')
 
     return detected, scale, r, img if flip is not None or rotate is not None else None
 
 
-basis_vectors = {
-    'x': np.array((1, 0, 0)),
-    'y': np.array((0, 1, 0)),
-    'z': np.array((0, 0, 1))
-}
+# Rows of _BASIS are the unit X, Y, and Z axes
+_BASIS = np.eye(3, dtype=np.float32)
+_DIR = {'x': 0, 'y': 1, 'z': 2}
 
 
 def main():
@@ -339,6 +414,12 @@ def main():
                               'instead use the mean directions calculated from '
                               'the sample square markers. These are often less '
                               'globally accurate than the bounding box edges.')
+    ss_opts.add_argument('--detection-reduction', type=int,
+                         choices=list(IMREAD_REDUCED.keys()), default=1,
+                         help='Detect the sample square in a copy of the '
+                              'texture image downsampled by this factor. '
+                              'Reduces peak memory usage for large textures '
+                              'at the cost of key point precision.')
     ss_opts.add_argument('--parallel-atol', type=float,
                          help='Tolerance for detecting parallel vectors when '
                               'calculating vector-to-vector rotation.')
@@ -370,6 +451,11 @@ def main():
     print('Loading mesh...')
     mesh = wobj.load_obj(args.input_file)
     poly_data = wobj.mesh_to_polydata(mesh)
+    verts = np.asarray(mesh.vertices, dtype=np.float64)[:, :3]
+
+    # Triangle array for normal generation and calibration. Only built when
+    # one of them needs it.
+    polys = None
 
     # Find path to a texture image
     texture_path = None
@@ -390,15 +476,18 @@ def main():
             args.sample_square_calibration = False
         else:
             print('Loading texture image...')
-            img = cv2.imread(str(texture_path))
+            img = cv2.imread(str(texture_path),
+                             IMREAD_REDUCED[args.detection_reduction])
 
-    # Calculate normals
+    # Generate normals for the output mesh
     if poly_data.GetPointData().HasArray('Normals') == 0:
         print('Generating normals...')
-        ngen = vtkTriangleMeshPointNormals()
-        ngen.SetInputData(poly_data)
-        ngen.Update()
-        poly_data = ngen.GetOutput()
+        polys = polygons_to_array(mesh.polygons)
+        tmesh = trimesh.Trimesh(vertices=verts, faces=polys[:, :, 0],
+                                process=False)
+        nrml_data = numpy_to_vtk(tmesh.vertex_normals, deep=True)
+        nrml_data.SetName('Normals')
+        poly_data.GetPointData().SetNormals(nrml_data)
 
     # overwrite default parallel vec tolerance
     # better to pass this as a var all the way through to usage, but I'm lazy
@@ -431,6 +520,9 @@ def main():
         # Center mesh on origin
         trans[0:3, 3] = -(corner + 0.5 * (max_edge + mid_edge + min_edge))
 
+        if polys is None:
+            polys = polygons_to_array(mesh.polygons)
+
         # Calculate scale and orientation from sample square
         detected = False
         if args.sample_square_calibration:
@@ -438,12 +530,14 @@ def main():
             if not args.use_marker_dirs:
                 edges = (max_edge, mid_edge, min_edge)
             detected, scale, rot[0:3, 0:3], new_img = sample_square_calibration(
-                mesh, img, edges, compute_scale=not args.no_scale)
+                mesh, verts, polys, img, edges, compute_scale=not args.no_scale,
+                texture_path=texture_path, reduction=args.detection_reduction)
 
         # Fallback to bounding box method if sample square disabled/failed
         if not args.sample_square_calibration or not detected:
             print('Starting bounding box calibration...')
-            scale, rot[0:3, 0:3] = bounding_box_calibration(poly_data,
+            scale, rot[0:3, 0:3] = bounding_box_calibration(verts,
+                                                            polys[:, :, 0],
                                                             max_edge,
                                                             mid_edge,
                                                             args.max_dir,
@@ -452,16 +546,23 @@ def main():
                                                             args.flip_mid)
 
         # Setup transform matrix
-        tfm_mat = scale @ rot @ trans
+        tfm_mat = np.linalg.multi_dot([scale, rot, trans])
 
     # transform polydata
     print('Transforming mesh...')
-    tfm = vtkTransform()
-    tfm.SetMatrix(tfm_mat.flatten().tolist())
-    transformer = vtkTransformPolyDataFilter()
-    transformer.SetInputData(poly_data)
-    transformer.SetTransform(tfm)
-    transformer.Update()
+    pts = poly_data.GetPoints()
+    pt_data = vtk_to_numpy(pts.GetData())
+    linear = tfm_mat[:3, :3].astype(pt_data.dtype)
+    pt_data[:] = pt_data @ linear.T + tfm_mat[:3, 3].astype(pt_data.dtype)
+    pts.Modified()
+
+    # normals transform by the inverse transpose of the linear component
+    nrml_data = poly_data.GetPointData().GetNormals()
+    if nrml_data is not None:
+        normals = vtk_to_numpy(nrml_data)
+        normals[:] = normals @ np.linalg.inv(linear).astype(normals.dtype)
+        normals /= np.linalg.norm(normals, axis=1, keepdims=True)
+        nrml_data.Modified()
 
     # save transform
     if args.save_transform is not None:
@@ -470,7 +571,7 @@ def main():
 
     # convert back to WavefrontOBJ
     print('Preparing output obj file...')
-    mesh_tfm = wobj.polydata_to_mesh(transformer.GetOutput(), src_mesh=mesh)
+    mesh_tfm = wobj.polydata_to_mesh(poly_data, src_mesh=mesh)
 
     # collect replacement textures
     textures = None
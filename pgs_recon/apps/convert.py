@@ -1,23 +1,25 @@
 import argparse
-import json
 import logging
 import os
+import queue
 import shutil
 import sys
-from concurrent.futures import ThreadPoolExecutor
+import threading
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime as dt, timezone as tz
 from pathlib import Path
 
 import configargparse
+import exiftool
 import imageio.v3 as iio
 import numpy as np
+import orjson
+import tifffile
 from educelab import imgproc
 from educelab.imgproc import pipeline
 from skimage import img_as_float
 from tqdm import tqdm
 
-from pgs_recon.utility import run_command
-
 
 def write_config(args, config_path=None):
     # Setup experiment
@@ -41,6 +43,169 @@ def has_group_opt(args, grp):
     return any([getattr(args, b.dest) is not None for b in grp._group_actions])
 
 
+# Copy a file's contents with copy_file_range so the data never passes through
+# user space. Filesystems with reflink support can share the underlying
+# blocks. Falls back to shutil.copy2 if the kernel call isn't available.
+def _copy_file(src, dst):
+    if not hasattr(os, 'copy_file_range'):
+        return shutil.copy2(src, dst)
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        remaining = os.fstat(fsrc.fileno()).st_size
+        try:
+            while remaining > 0:
+                n = os.copy_file_range(fsrc.fileno(), fdst.fileno(), remaining)
+                if n == 0:
+                    break
+                remaining -= n
+        except OSError:
+            # e.g. cross-device copies on older kernels
+            fdst.truncate(0)
+            fdst.seek(0)
+            fsrc.seek(0)
+            shutil.copyfileobj(fsrc, fdst)
+    shutil.copystat(src, dst)
+    return dst
+
+
+# Enhancement pipeline for the current process. Built from the parsed command
+# list by _init_worker since the pipeline closure can't be pickled.
+_apply_pipeline = None
+
+
+def _init_worker(cmds):
+    global _apply_pipeline
+    _apply_pipeline = pipeline.build_pipeline(cmds)
+
+
+# Load an image. Returns None if the file can't be read.
+def _load_image(p):
+    try:
+        img = iio.imread(p)
+    except (OSError, ValueError):
+        return None
+    # Treat anything other than decoded pixel data as a failed read
+    if not isinstance(img, np.ndarray):
+        return None
+    return img
+
+
+# Run the enhancement pipeline and convert to the output dtype
+def _process_image(img, file_type):
+    in_dtype = img.dtype
+
+    # Convert to float for processing. Unsigned images are scaled to [0, 1] in
+    # float32 since the pipeline doesn't need double precision.
+    if np.issubdtype(in_dtype, np.unsignedinteger):
+        img = img.astype(np.float32)
+        img *= np.float32(1. / np.iinfo(in_dtype).max)
+    else:
+        img = img_as_float(img)
+
+    # Process the image
+    img = _apply_pipeline(img)
+
+    # Type conversion
+    if file_type == 'jpg':
+        out_dtype = np.uint8
+    else:
+        out_dtype = in_dtype
+    # Clip and rescale in place so the only new allocation is the final cast
+    np.clip(img, 0., 1., out=img)
+    if np.issubdtype(out_dtype, np.unsignedinteger):
+        img *= np.iinfo(out_dtype).max
+        img = img.astype(out_dtype)
+    else:
+        img = imgproc.as_dtype(img, out_dtype)
+    return img
+
+
+# Write an image to disk. TIFFs are written with tifffile directly through a
+# 1 MiB write buffer.
+def _write_image(out_path, img, file_type, write_opts):
+    if file_type == 'tif':
+        # Float data would use the floating point predictor, which needs
+        # imagecodecs. Only apply horizontal differencing to integer images.
+        if (write_opts.get('predictor')
+                and not np.issubdtype(img.dtype, np.integer)):
+            write_opts = {**write_opts, 'predictor': False}
+        with out_path.open('wb', buffering=1 << 20) as f:
+            tifffile.imwrite(f, img, **write_opts)
+    else:
+        iio.imwrite(out_path, img, **write_opts)
+
+
+# Convert a single image.
+# task: (input path, output dir, file type, imwrite kwargs)
+def _convert_image(task) -> tuple[bool, str]:
+    p, output_dir, file_type, write_opts = task
+
+    # Load image
+    img = _load_image(p)
+    if img is None:
+        return False, p.name
+
+    # Process the image
+    img = _process_image(img, file_type)
+
+    # Save the image to disk
+    out_path = output_dir / p.with_suffix(f'.{file_type}').name
+    _write_image(out_path, img, file_type, write_opts)
+    return True, p.name
+
+
+# Convert images in the current process. Reading, processing, and writing run
+# concurrently in separate threads connected by bounded queues.
+def _convert_images_pipelined(images, output_dir, file_type, write_opts) -> \
+        list[tuple[bool, str]]:
+    read_q = queue.Queue(maxsize=4)
+    write_q = queue.Queue(maxsize=4)
+    results = []
+    errors = []
+
+    def read_images():
+        try:
+            for p in images:
+                read_q.put((p, _load_image(p)))
+        except Exception as e:
+            errors.append(e)
+        finally:
+            read_q.put(None)
+
+    def write_images():
+        try:
+            for p, img in tqdm(iter(write_q.get, None), total=len(images),
+                               desc='Converting images'):
+                if img is None:
+                    results.append((False, p.name))
+                    continue
+                out_path = output_dir / p.with_suffix(f'.{file_type}').name
+                _write_image(out_path, img, file_type, write_opts)
+                results.append((True, p.name))
+        except Exception as e:
+            errors.append(e)
+            # Keep draining so the main thread never blocks on a full queue
+            for _ in iter(write_q.get, None):
+                pass
+
+    reader = threading.Thread(target=read_images, daemon=True)
+    writer = threading.Thread(target=write_images, daemon=True)
+    reader.start()
+    writer.start()
+    for p, img in iter(read_q.get, None):
+        if errors:
+            break
+        if img is not None:
+            img = _process_image(img, file_type)
+        write_q.put((p, img))
+    write_q.put(None)
+    writer.join()
+
+    # Re-raise the first reader/writer failure on the main thread
+    if errors:
+        raise errors[0]
+    return results
+
+
 def main():
     parser = configargparse.ArgumentParser(prog='pgs-convert')
     parser.add_argument('--config', '-c', is_config_file=True,
@@ -73,6 +238,11 @@ def main():
     convert_opts.add_argument('--quality', '-q', type=int,
                               help='Output image quality. Range depends on '
                                    '--file-type')
+    convert_opts.add_argument('--tiff-compression', default='deflate',
+                              choices=['deflate', 'lzma', 'none'],
+                              help='Compression codec for TIFF output')
+    convert_opts.add_argument('--tiff-level', type=int, default=6,
+                              help='Compression level for TIFF output')
 
     file_opts = parser.add_argument_group('file filter options')
     file_opts.add_argument('--filter-cam', type=int, metavar='INT',
@@ -83,16 +253,17 @@ def main():
                            help='Filter by capture index')
 
     perf_opts = parser.add_argument_group('performance options')
-    perf_opts.add_argument('--threads', '-t', type=int,
-                           help="Maximum number of threads to use when "
-                                "converting images")
+    perf_opts.add_argument('--jobs', '-j', '--threads', '-t', type=int,
+                           dest='jobs',
+                           help="Maximum number of worker processes to use "
+                                "when converting images")
 
     # add the enhancement pipeline options
     enhance_opts = pipeline.add_parser_enhancement_group(parser)
 
     # parse arguments and commands
     args = parser.parse_args()
-    apply_pipeline, cmds = pipeline.parse_and_build(args.commands)
+    _, cmds = pipeline.parse_and_build(args.commands)
 
     logging.basicConfig(level=args.log_level)
     logger = logging.getLogger('pgs-convert')
@@ -111,8 +282,7 @@ def main():
     if not meta_path.exists():
         logger.error(f'File not found: {str(meta_path)}')
         sys.exit(1)
-    with meta_path.open(encoding='utf-8') as f:
-        meta = json.loads(f.read())
+    meta = orjson.loads(meta_path.read_bytes())
 
     # Get file name info
     prefix = meta['scan']['file_prefix']
@@ -133,7 +303,7 @@ def main():
             logger.info('Input dataset matches requested format. '
                         'Copying to the output directory.')
             try:
-                shutil.copytree(scan_dir, output_dir,
+                shutil.copytree(scan_dir, output_dir, copy_function=_copy_file,
                                 dirs_exist_ok=args.force_copy)
             except FileExistsError as e:
                 logger.error(e)
@@ -160,9 +330,9 @@ def main():
     # If we're on a SLURM node, os.cpu_count returns the hardware CPUs, which is
     # not necessarily what's available to the job. To avoid deadlocks, override
     # the default with what's actually usable.
-    if args.threads is None and 'SLURM_JOB_CPUS_PER_NODE' in os.environ.keys():
-        args.threads = int(os.environ['SLURM_JOB_CPUS_PER_NODE'])
-    logger.debug(f'Max worker threads: {"auto" if args.threads is None else args.threads}')
+    if args.jobs is None and 'SLURM_JOB_CPUS_PER_NODE' in os.environ.keys():
+        args.jobs = int(os.environ['SLURM_JOB_CPUS_PER_NODE'])
+    logger.debug(f'Max worker processes: {"auto" if args.jobs is None else args.jobs}')
 
     # Write config before convert
     write_config(args)
@@ -173,92 +343,71 @@ def main():
     if len(cmds):
         meta['enhancements'] = cmds
     meta_path = output_dir / 'metadata.json'
-    with meta_path.open('w', encoding='utf8') as f:
-        json.dump(meta, f, indent=4)
-
-    # Define conversion function
-    def convert_image(p) -> tuple[bool, Path]:
-        # Load image
-        try:
-            img = iio.imread(p)
-        except (OSError, ValueError):
-            logger.error(f'Failed to load file: {str(p)}')
-            return False, p.name
-        in_dtype = img.dtype
-
-        # Convert to float for processing
-        img = img_as_float(img)
-
-        # Process the image
-        img = apply_pipeline(img)
-
-        # Determine output format
-        kwargs = {}
-
-        # Type conversion
-        if args.file_type == 'jpg':
-            out_dtype = np.uint8
-        else:
-            out_dtype = in_dtype
-        img = np.clip(img, 0., 1.)
-        img = imgproc.as_dtype(img, out_dtype)
-
-        # Format specific opts
-        if args.file_type == 'jpg':
-            kwargs[
-                'quality'] = args.quality if args.quality is not None else 100
-        elif args.file_type == 'tif':
-            kwargs['compression'] = 'zlib'
-            kwargs['compressionargs'] = {'level': 9}
-
-        # Save the image to disk
-        out_file = p.with_suffix(f'.{args.file_type}').name
-        out_path = output_dir / out_file
-        iio.imwrite(out_path, img, **kwargs)
-        return True, p.name
-
-    # Convert images (single-threaded)
-    results = []
-    if args.threads == 1:
-        for p in tqdm(images, desc='Converting images'):
-            results.append(convert_image(p))
-    # Convert images (multithreaded)
+    meta_path.write_bytes(orjson.dumps(meta, option=orjson.OPT_INDENT_2))
+
+    # Format specific write opts
+    write_opts = {}
+    if args.file_type == 'jpg':
+        write_opts['quality'] = args.quality if args.quality is not None else 100
+    elif args.file_type == 'tif':
+        # Tiled with horizontal differencing (integer images only) for better
+        # compression
+        write_opts['tile'] = (256, 256)
+        if args.tiff_compression != 'none':
+            write_opts['compression'] = args.tiff_compression
+            write_opts['compressionargs'] = {'level': args.tiff_level}
+            write_opts['predictor'] = True
+
+    # Convert images (single process)
+    if args.jobs == 1:
+        _init_worker(cmds)
+        results = _convert_images_pipelined(images, output_dir,
+                                            args.file_type, write_opts)
+    # Convert images (multiprocess)
     else:
-        with ThreadPoolExecutor(max_workers=args.threads) as executor:
-            futures = executor.map(convert_image, images)
+        tasks = [(p, output_dir, args.file_type, write_opts) for p in images]
+        with ProcessPoolExecutor(max_workers=args.jobs,
+                                 initializer=_init_worker,
+                                 initargs=(cmds,)) as executor:
+            futures = executor.map(_convert_image, tasks, chunksize=4)
             results = list(
-                tqdm(futures, total=len(images), desc='Converting images'))
+                tqdm(futures, total=len(tasks), desc='Converting images'))
+    for success, name in results:
+        if not success:
+            logger.error(f'Failed to load file: {str(scan_dir / name)}')
+
     # Report success
     failed_files = [r[1] for r in results if not r[0]]
     if len(failed_files) > 0:
         logger.warning(f'{len(failed_files)} images failed to convert.')
         meta['conversion'] = {'failed': failed_files}
-        with meta_path.open('w', encoding='utf8') as f:
-            json.dump(meta, f, indent=4)
+        meta_path.write_bytes(orjson.dumps(meta, option=orjson.OPT_INDENT_2))
 
     # Setup metadata copy
-    cmd = ['exiftool', '-q', '-P', '-overwrite_original']
+    tag_args = []
 
     # Skip tags that don't make sense in JPGs
     if args.file_type in ['jpg', 'png']:
-        cmd.extend(['-XMP-tiff:all=', '-ExifIFD:BitsPerSample=',
-                    '-IFD0:BitsPerSample='])
+        tag_args.extend(['-XMP-tiff:all=', '-ExifIFD:BitsPerSample=',
+                         '-IFD0:BitsPerSample='])
 
-    # Original tags from original files
-    # Use dummy _ to get OS separator then strip dummy _
-    meta_dir = str(scan_dir / '_')[:-1]
-    cmd.extend(['-TagsFromFile', f'{meta_dir}%f.{ext}'])
-
-    # Map all the other tags
-    cmd.append('-all:all')
-
-    # Iterate over the output dir
-    cmd.append(str(output_dir))
-
-    # Copy metadata
+    # Copy metadata from the original files through a single exiftool process
     logger.info('Copying metadata...')
-    logger.debug(f'Metadata args: {cmd}')
-    run_command(cmd)
+    try:
+        with exiftool.ExifTool(
+                common_args=['-q', '-P', '-overwrite_original']) as et:
+            for success, name in results:
+                if not success:
+                    continue
+                src = scan_dir / name
+                dst = output_dir / src.with_suffix(f'.{args.file_type}').name
+                cmd = tag_args + ['-TagsFromFile', str(src), '-all:all',
+                                  str(dst)]
+                logger.debug(f'Metadata args: {cmd}')
+                et.execute(*cmd)
+    except OSError as e:
+        logger.error(f'Failed to start exiftool: {e}')
+        sys.exit(1)
 
 
 if __name__ == '__main__':
@@ -1,9 +1,10 @@
 import argparse
 from pathlib import Path
 import sys
-import json
 
-from pgs_recon.utils.apps import ANSICode
+import orjson
+
+from pgs_recon.utils.apps import ANSICode, dir_contents
 
 
 def process_scan(input_dir):
@@ -12,14 +13,13 @@ def process_scan(input_dir):
 
     # Check for metadata file
     meta_path = input_dir / 'metadata.json'
-    if not meta_path.exists():
+    if meta_path.name not in dir_contents(input_dir):
         print('  metadata.json')
         print(f'{ANSICode.FAIL}Missing 1 file{ANSICode.ENDC}\n')
         return
 
     # Load the metadata
-    with meta_path.open() as f:
-        meta = json.loads(f.read())
+    meta = orjson.loads(meta_path.read_bytes())
 
     # Get the number of capture positions
     num_positions = len(meta['scan']['capture_positions'])
@@ -36,18 +36,19 @@ def process_scan(input_dir):
     prefix = meta['scan']['file_prefix']
     ext = meta['scan']['format'].lower()
 
-    # Check each file
-    missing = 0
+    # Check each file against a single listing of the directory
+    found = dir_contents(input_dir)
+    missing = []
     for pos in range(num_positions):
         for cap in range(num_caps):
             for cam in cams_per_cap[cap]:
                 f = f'{prefix}{cam:03}_{pos:05}_{cap:02}.{ext}'
-                if not (input_dir / f).exists():
-                    missing += 1
-                    print(f'  {f}')
-    s = ANSICode.FAIL if missing > 0 else ANSICode.OKGREEN
+                if f not in found:
+                    missing.append(f'  {f}\n')
+    s = ANSICode.FAIL if len(missing) > 0 else ANSICode.OKGREEN
     e = ANSICode.ENDC
-    print(f'{s}Missing {missing} files{e}\n')
+    missing.append(f'{s}Missing {len(missing)} files{e}\n\n')
+    sys.stdout.write(''.join(missing))
 
 
 def main():
@@ -63,7 +64,7 @@ def main():
             print('Error: Input is not a directory')
             continue
 
-        if (input_dir / 'metadata.json').exists():
+        if 'metadata.json' in dir_contents(input_dir):
             process_scan(input_dir)
         else:
             for d in sorted(list(input_dir.iterdir())):
@@ -2,8 +2,10 @@ import argparse
 from pathlib import Path
 
 import cv2
+import imageio.v3 as iio
 
 from pgs_recon.utils import educelab
+from pgs_recon.utils.images import IMREAD_REDUCED
 
 
 def main():
@@ -16,13 +18,20 @@ def main():
     parser.add_argument('--open-iterations', type=int, default=4,
                         help='The number of morphological open operations to '
                              'apply to the thresholded image')
+    parser.add_argument('--scale', type=int, choices=list(IMREAD_REDUCED.keys()),
+                        default=1,
+                        help='Generate the mask from a copy of the image '
+                             'downsampled by this factor. The mask is upsampled '
+                             'to the full image resolution before saving. The '
+                             'morphological filter size is fixed in pixels, '
+                             'so results may differ from full resolution.')
     parser.add_argument('--debug', action='store_true',
                         help='If provided, save intermediate images for '
                              'debugging mask generation')
     args = parser.parse_args()
 
     # Load img
-    img = cv2.imread(args.input_file)
+    img = cv2.imread(args.input_file, IMREAD_REDUCED[args.scale])
     print(f'Loaded image: {img.shape}')
 
     # Generate mask
@@ -31,6 +40,15 @@ def main():
                                        open_iterations=args.open_iterations,
                                        save_debug=args.debug)
 
+    # Upsample to the original image size
+    if args.scale > 1:
+        h, w = iio.improps(args.input_file).shape[:2]
+        # cv2.imread applies the EXIF orientation but improps does not
+        meta = iio.immeta(args.input_file, exclude_applied=False)
+        if meta.get('Orientation', 1) in (5, 6, 7, 8):
+            h, w = w, h
+        mask = cv2.resize(mask, (w, h), interpolation=cv2.INTER_NEAREST)
+
     # Save image mask
     if args.output_file is None:
         input_file = Path(args.input_file)
@@ -1,22 +1,25 @@
 import argparse
-import json
 import logging
+import os
 import sys
 from pathlib import Path
 
+import orjson
+
+from pgs_recon.utils.apps import dir_contents
+
 
 def scan_is_complete(scan_dir: Path, meta=None) -> bool:
     # Load metadata dict if we haven't been given one
     if meta is None:
         # Check if we have a metadata file
         meta_path = scan_dir / 'metadata.json'
-        if not meta_path.exists():
+        if meta_path.name not in dir_contents(scan_dir):
             logging.info(f'[{str(scan_dir)}] missing metadata.json')
             return False
 
         # Load the metadata
-        with meta_path.open() as f:
-            meta = json.loads(f.read())
+        meta = orjson.loads(meta_path.read_bytes())
 
     # Check for primary keys
     if 'scan' not in meta.keys():
@@ -60,17 +63,30 @@ def scan_is_complete(scan_dir: Path, meta=None) -> bool:
     # Collect a list of images
     prefix = meta['scan']['file_prefix']
     ext = meta['scan']['format'].lower()
-    images = list(scan_dir.glob(f'{prefix}*.{ext}'))
+    num_found = sum(1 for f in dir_contents(scan_dir)
+                    if f.startswith(prefix) and f.endswith(f'.{ext}'))
 
     # Check if we have all images
-    if len(images) == num_images:
+    if num_found == num_images:
         return True
     else:
-        missing = num_images - len(images)
+        missing = num_images - num_found
         logging.info(f'[{str(scan_dir)}] missing {missing} images')
         return False
 
 
+# Yield all subdirectories of root in sorted order. Directories containing a
+# metadata.json are yielded but not descended into.
+def iter_scan_dirs(root: Path):
+    with os.scandir(root) as it:
+        entries = sorted((e for e in it if e.is_dir()), key=lambda e: e.name)
+    for e in entries:
+        d = Path(e.path)
+        yield d
+        if not e.is_symlink() and 'metadata.json' not in dir_contents(d):
+            yield from iter_scan_dirs(d)
+
+
 def main():
     parser = argparse.ArgumentParser('pgs-list-complete')
     parser.add_argument('input', metavar='DIR', nargs='+',
@@ -99,33 +115,29 @@ def main():
     incomplete = []
     for input_dir in args.input:
         input_dir = Path(input_dir)
-        for d in sorted(list(input_dir.rglob('*'))):
-            # Skip things that aren't directories
-            if not d.is_dir():
-                continue
-
+        for d in iter_scan_dirs(input_dir):
             if scan_is_complete(d):
                 complete.append(d)
             else:
                 incomplete.append(d)
 
+    # format each list once
+    complete = ''.join(f'{str(d)}\n' for d in complete)
+    incomplete = ''.join(f'{str(d)}\n' for d in incomplete)
+
     # print to console
     if args.report_complete:
-        for d in complete:
-            print(str(d))
+        sys.stdout.write(complete)
 
     if args.report_incomplete:
-        for d in incomplete:
-            print(str(d), file=sys.stderr)
+        sys.stderr.write(incomplete)
 
     # save to file
     if args.complete_file is not None:
-        with Path(args.complete_file).open('w') as of:
-            of.writelines(f'{str(d)}\n' for d in complete)
+        Path(args.complete_file).write_text(complete)
 
     if args.incomplete_file is not None:
-        with Path(args.incomplete_file).open('w') as of:
-            of.writelines(f'{str(d)}\n' for d in incomplete)
+        Path(args.incomplete_file).write_text(incomplete)
 
 
 if __name__ == '__main__':
@@ -1,11 +1,12 @@
 import argparse
-import json
+import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+import cv2
 import imageio.v3 as iio
-import matplotlib.pyplot as plt
 import numpy as np
-from skimage.measure import blur_effect
+import orjson
 from tqdm import tqdm
 
 from pgs_recon.utils import quality
@@ -17,13 +18,16 @@ def main():
     parser.add_argument('--pgs-dir', '-p', required=True,
                         help='PGS Scan directory')
     parser.add_argument('--save-plots', action='store_true')
+    parser.add_argument('--fast', action='store_true',
+                        help='Calculate metrics on a grayscale, 1/8 scale '
+                             'decode of each image. JPEGs are decoded at the '
+                             'reduced scale directly.')
     args = parser.parse_args()
 
     # Load scan metadata
     scan_dir = Path(args.pgs_dir)
     meta_path = scan_dir / 'metadata.json'
-    with meta_path.open() as f:
-        meta = json.loads(f.read())
+    meta = orjson.loads(meta_path.read_bytes())
 
     # setup data structure
     num_cam = len(meta['scanner']['cameras'])
@@ -37,22 +41,54 @@ def main():
     ext = meta['scan']['format'].lower()
     images = list(scan_dir.glob(f'{prefix}*.{ext}'))
     images.sort()
+    if len(images) == 0:
+        print('Error: No images found in directory.')
+        sys.exit(1)
 
-    # calculate the metrics
-    dynamic_range = None
-    for p in tqdm(images, 'Calculating metrics'):
+    # Deferred so the early exits above don't pay for these imports
+    import matplotlib
+    if args.save_plots:
+        matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    from skimage.measure import blur_effect
+    from sklearn import neighbors
+
+    # calculate the metrics for a single image
+    def compute_metrics(p):
         # parse the image indices
         indices = p.name.removeprefix(prefix).removesuffix(f'.{ext}').split('_')
-        cam, pos, cap = [int(idx) for idx in indices]
+        idxs = tuple(int(idx) for idx in indices)
 
         # Load the image
-        img = iio.imread(p)
+        if args.fast:
+            img = cv2.imread(str(p), cv2.IMREAD_REDUCED_GRAYSCALE_8 |
+                             cv2.IMREAD_ANYDEPTH)
+            # cv2.imread returns None rather than raising like iio.imread
+            if img is None:
+                raise OSError(f'Failed to load image: {p}')
+        else:
+            img = iio.imread(p)
+
+        # (0) Calculate the mean brightness
+        # (1) Calculate the blur effect
+        return idxs, img.dtype, quality.measure_exposure(img), blur_effect(img)
 
-        # update the global dynamic range
+    # calculate the metrics
+    with ThreadPoolExecutor() as executor:
+        results = list(tqdm(executor.map(compute_metrics, images),
+                            'Calculating metrics', total=len(images)))
+    idxs, dtypes, exposures, blurs = zip(*results)
+    cam, pos, cap = np.array(idxs).T
+    metrics[cam, pos, cap, 0] = exposures
+    metrics[cam, pos, cap, 1] = blurs
+
+    # update the global dynamic range
+    dynamic_range = None
+    for dtype in dict.fromkeys(dtypes):
         high = None
-        if img.dtype == np.uint8:
+        if dtype == np.uint8:
             high = 2 ** 8 - 1
-        elif img.dtype == np.uint16:
+        elif dtype == np.uint16:
             high = 2 ** 16 - 1
         if high is not None:
             if dynamic_range is None:
@@ -60,12 +96,6 @@ def main():
             else:
                 dynamic_range[1] = max(dynamic_range[1], 255)
 
-        # (0) Calculate the mean brightness
-        metrics[cam, pos, cap, 0] = quality.measure_exposure(img)
-
-        # (1) Calculate the blur effect
-        metrics[cam, pos, cap, 1] = blur_effect(img)
-
     # plot
     fig, axs = plt.subplots(2, 2, figsize=(6.4 * 2, 4.8 * 2))
     fig.suptitle(scan_dir.name)
@@ -1,54 +1,74 @@
 """Run the photogrammetry pipeline on a set of input images."""
 import argparse
-import atexit
+import hashlib
 import json
 import logging
+import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime as dt, timezone as tz
 from pathlib import Path
 
-import exiftool
 import configargparse
-import sfm_utils as sfm
-
-from pgs_recon.openmvg import (compute_features, compute_matches,
-                               geometric_filter, init_sfm_generic,
-                               mvg_colorize_sfm, mvg_compute_known, mvg_sfm,
-                               mvg_autoscale, mvg_to_mvs)
-from pgs_recon.openmvs import (mvs_densify, mvs_reconstruct, mvs_refine,
-                               mvs_texture)
-from pgs_recon.pgs_data import init_sfm_pgs, get_tag_option
-from pgs_recon.utility import current_timestamp
+import orjson
+
+from pgs_recon.utility import (available_cpus, cpu_has_flag,
+                               current_timestamp)
 from pgs_recon.utils.apps import setup_logging
 
 
+# EXIF tags read by init_sfm_generic2
+_EXIF_TAGS = ['File:FileName', 'File:ImageWidth', 'File:ImageHeight',
+              'EXIF:ImageWidth', 'EXIF:ImageHeight', 'EXIF:Make', 'EXIF:Model',
+              'EXIF:FocalLength']
+
+
+def _read_exif_tags(files: list) -> list:
+    """Read the importer's EXIF tags from a list of files"""
+    import exiftool
+    with exiftool.ExifToolHelper() as et:
+        return et.get_tags(files, tags=_EXIF_TAGS)
+
+
 def init_sfm_generic2(scan_dir: Path, sfm_file: Path, camdb_path: Path):
     """Init an SfM scene from the given directory"""
+    import sfm_utils as sfm
+
+    from pgs_recon.pgs_data import HEIGHT_TAGS, WIDTH_TAGS, get_tag_option
+
     logger = logging.getLogger(__name__)
     # Load the camera db
     cam_db = sfm.openmvg_load_camdb(camdb_path)
 
     # Get a list of files
-    extensions = {'.tif', '.tiff', '.jpg', '.jpeg', '.png'}
-    extensions = extensions.union([ext.upper() for ext in extensions])
-    all_files = list(scan_dir.glob(f'*.*'))
-    all_files.sort()
+    extensions = frozenset({'tif', 'tiff', 'jpg', 'jpeg', 'png'})
     images = []
-    for f in all_files:
-        if 'mask.png' in str(f):
-            logger.warning(f'{str(f.name)} is a mask image')
-        elif Path(f).suffix in extensions:
-            images.append(f)
-        else:
-            logger.debug(f'Ignoring file: {str(f.name)}')
+    with os.scandir(scan_dir) as it:
+        for e in it:
+            # Like glob, skip hidden files (e.g. macOS ._* resource forks)
+            if e.name.startswith('.') or not e.is_file():
+                continue
+            if e.name == 'mask.png' or e.name.endswith('_mask.png'):
+                logger.warning('%s is a mask image', e.name)
+            elif e.name.rpartition('.')[2].lower() in extensions:
+                images.append(Path(e.path))
+            else:
+                logger.debug('Ignoring file: %s', e.name)
+    images.sort()
     if len(images) == 0:
         logger.error(
             'Provided scan metadata specifies file pattern, but no files match.')
         raise RuntimeError()
 
-    # Get image metadata
-    with exiftool.ExifToolHelper() as et:
-        img_metadata = et.get_metadata([str(i) for i in images])
+    # Get image metadata, indexed by file name. Large scans are split across
+    # several exiftool processes.
+    files = [str(i) for i in images]
+    workers = min(8, available_cpus()) if len(files) >= 200 else 1
+    chunk = -(-len(files) // workers)
+    chunks = [files[i:i + chunk] for i in range(0, len(files), chunk)]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(_read_exif_tags, chunks)
+        img_metadata = {m['File:FileName']: m for r in results for m in r}
 
     # Setup sfm
     scene = sfm.Scene()
@@ -57,17 +77,16 @@ def init_sfm_generic2(scan_dir: Path, sfm_file: Path, camdb_path: Path):
     # Fill out sfm with data
     for img in images:
         # Lookup this images tags
-        tags = next((i for i in img_metadata if i['File:FileName'] == img.name),
-                    None)
+        tags = img_metadata.get(img.name)
         if tags is None:
-            logger.error(f'No tags loaded for image: {str(img.name)}')
+            logger.error('No tags loaded for image: %s', img.name)
             continue
 
         # Setup view
         view = sfm.View()
         view.path = img
-        view.width = get_tag_option(tags, ['File:ImageWidth', 'EXIF:ImageWidth'])
-        view.height = get_tag_option(tags, ['File:ImageHeight', 'EXIF:ImageHeight'])
+        view.width = get_tag_option(tags, WIDTH_TAGS)
+        view.height = get_tag_option(tags, HEIGHT_TAGS)
         view.make = tags['EXIF:Make']
         view.model = tags['EXIF:Model']
 
@@ -76,14 +95,14 @@ def init_sfm_generic2(scan_dir: Path, sfm_file: Path, camdb_path: Path):
         intrinsic.width = view.width
         intrinsic.height = view.height
         intrinsic.focal_length = tags['EXIF:FocalLength']
-        if f'{view.make} {view.model}' in cam_db.keys():
-            intrinsic.sensor_width = cam_db[f'{view.make} {view.model}']
-        elif f'{view.model}' in cam_db.keys():
-            intrinsic.sensor_width = cam_db[f'{view.model}']
-        else:
-            logger.warning(
-                f'Camera not in database: {view.make} {view.model}. Ignoring file: {img.name}')
+        sensor_width = cam_db.get(f'{view.make} {view.model}')
+        if sensor_width is None:
+            sensor_width = cam_db.get(f'{view.model}')
+        if sensor_width is None:
+            logger.warning('Camera not in database: %s %s. Ignoring file: %s',
+                           view.make, view.model, img.name)
             continue
+        intrinsic.sensor_width = sensor_width
 
         # Only add everything to the SfM at the end
         scene.add_view(view)
@@ -93,6 +112,22 @@ def init_sfm_generic2(scan_dir: Path, sfm_file: Path, camdb_path: Path):
     sfm.export_scene(path=sfm_file, scene=scene)
 
 
+def file_fingerprint(path: Path) -> list:
+    """Identify a file (or the files in a directory) by name, size, and mtime"""
+    if path.is_dir():
+        entries = [e for e in os.scandir(path) if e.is_file()]
+        entries.sort(key=lambda e: e.name)
+    else:
+        entries = [path]
+    return [(e.name, e.stat().st_size, e.stat().st_mtime_ns) for e in entries]
+
+
+def stage_hash(parent: str, stage: str, **params) -> str:
+    """Hash a stage's parameters, chained to the hash of the stage before it"""
+    data = json.dumps([parent, stage, params], sort_keys=True, default=str)
+    return hashlib.blake2b(data.encode(), digest_size=16).hexdigest()
+
+
 def main():
     parser = configargparse.ArgumentParser(prog='pgs-recon')
 
@@ -121,6 +156,11 @@ def main():
                              'configurations.')
     parser.add_argument('--log-level', default='INFO', type=str.upper,
                         choices=['ERROR', 'WARNING', 'INFO', 'DEBUG'])
+    parser.add_argument('--skip-existing', default=False,
+                        action=argparse.BooleanOptionalAction,
+                        help='Skip the feature, matching, and SfM stages if '
+                             'their inputs and options are unchanged since '
+                             'the last run in the output directory')
 
     # Hidden opts
     parser.add_argument('--path', type=str, default='/usr/local/',
@@ -150,9 +190,16 @@ def main():
                                        'ANNL2',
                                        'CASCADEHASHINGL2',
                                        'FASTCASCADEHASHINGL2',
-                                       'BRUTEFORCEHAMMING'],
-                              default='FASTCASCADEHASHINGL2', type=str.upper,
-                              help='Feature matching method.')
+                                       'BRUTEFORCEHAMMING',
+                                       'HNSWL1',
+                                       'HNSWL2',
+                                       'HNSWHAMMING'],
+                              type=str.upper,
+                              help='Feature matching method. If AUTO or not '
+                                   'provided, uses the HNSW matcher suited to '
+                                   'the describer method: HNSWL1 (SIFT), '
+                                   'HNSWL2 (AKAZE_FLOAT), or '
+                                   'HNSWHAMMING (AKAZE_MLDB).')
     opts_matcher.add_argument('--matching-geometric-model',
                               choices=['f', 'e', 'h', 'a', 'u', 'o'],
                               type=str.lower,
@@ -163,6 +210,11 @@ def main():
                                    'upright essential matrix with angular '
                                    'parameterization, o: orthographic '
                                    'essential matrix')
+    opts_matcher.add_argument('--force-geometric-filter', default=False,
+                              action=argparse.BooleanOptionalAction,
+                              help='Run geometric filtering even when using '
+                                   'the direct reconstruction method, which '
+                                   'does not use the filtered matches')
     opts_matcher.add_argument('--matching-ratio', type=float, default=None,
                               help='Nearest-Neighbor distance ratio')
     opts_matcher.add_argument('--matching-pairs-file', type=str, default='auto',
@@ -285,21 +337,47 @@ def main():
     args = parser.parse_args()
     if args.mask_value is not None and args.mask_value < 0:
         args.mask_value = None
+    if args.threads is None:
+        args.threads = available_cpus()
+    # Keep OpenMP/BLAS code in the subprocesses (e.g. Ceres) within budget
+    for var in 'OMP_NUM_THREADS', 'MKL_NUM_THREADS':
+        os.environ.setdefault(var, str(args.threads))
+
+    # Defer the pipeline imports so --help and argument errors return quickly
+    from pgs_recon.openmvg import (HNSW_MATCHING_METHODS, compute_features,
+                                   compute_matches, geometric_filter,
+                                   init_sfm_generic, mvg_autoscale,
+                                   mvg_colorize_sfm, mvg_compute_known,
+                                   mvg_sfm, mvg_to_mvs)
+    from pgs_recon.openmvs import (mvs_densify, mvs_reconstruct, mvs_refine,
+                                   mvs_texture)
+    from pgs_recon.pgs_data import init_sfm_pgs
 
     setup_logging(args.log_level)
     logger = logging.getLogger("pgs-recon")
+    if args.matching_method in (None, 'AUTO'):
+        args.matching_method = HNSW_MATCHING_METHODS[args.describer_method]
+        logger.info('Using matching method: %s', args.matching_method)
+    if args.matching_method == 'BRUTEFORCEL2' and not cpu_has_flag('avx2'):
+        logger.warning('BRUTEFORCEL2 matching is much slower without AVX2 '
+                       'support. Consider an HNSW matching method.')
 
     # Structure for storing important paths
     logger.info('Setting up output directories')
     paths = {
         'PATH': Path(args.path).resolve(),
-        'input': Path(args.input),
-        'output': Path(args.output)
+        'input': Path(args.input).resolve(strict=True),
+        'output': Path(args.output).resolve()
     }
     if args.import_calib:
         paths['input_calib'] = Path(args.import_calib)
     paths['BIN'] = paths['PATH'] / 'bin'
     paths['MVS_BIN'] = paths['BIN'] / 'OpenMVS'
+    # Prefer OpenMVG binaries built with AVX2 when the host supports it
+    avx2_bin = paths['PATH'] / 'bin-avx2'
+    if avx2_bin.is_dir() and cpu_has_flag('avx2'):
+        logger.info('Using AVX2 binaries: %s', avx2_bin)
+        paths['BIN'] = avx2_bin
     if args.cam_db is None:
         db_path = 'lib/openMVG/sensor_width_camera_database.txt'
         paths['CAM_DB'] = paths['PATH'] / db_path
@@ -316,15 +394,15 @@ def main():
     paths['mvs_scene'] = paths['mvs'] / 'scene.mvs'
     paths['mvs_images'] = paths['mvs'] / 'undistorted_images'
 
-    # Create output folders
-    for d in 'output', 'mvg', 'matches_dir', 'recon_dir', 'mvs':
+    # Create output folders (parents=True creates output/ and mvg/)
+    for d in 'matches_dir', 'recon_dir', 'mvs':
         paths[d].mkdir(exist_ok=True, parents=True)
 
     # Setup experiment
     experiment_start = dt.now(tz.utc)
     datetime_str = experiment_start.strftime('%Y%m%d%H%M%S')
     if args.name is None:
-        args.name = datetime_str + '_' + str(Path(args.input).stem)
+        args.name = datetime_str + '_' + paths['input'].stem
         config = paths['output'] / f'{args.name}_recon_config.txt'
     else:
         config = paths['output'] / f'{datetime_str}_{args.name}_recon_config.txt'
@@ -332,154 +410,226 @@ def main():
     # Write config after all arguments have been changed
     args.config = str(config)
     with config.open(mode='w') as file:
-        for arg in vars(args):
-            attr = getattr(args, arg)
-            arg = arg.replace('_', '-')
-            file.write(f'{arg} = {attr}\n')
+        file.writelines(f'{arg.replace("_", "-")} = {attr}\n'
+                        for arg, attr in vars(args).items())
 
     # Init metadata
     metadata = {'args': " ".join(sys.argv),
-                'parsed': vars(args),
-                'paths': {key: str(val) for key, val in paths.items()},
+                'parsed': dict(vars(args)),
+                'paths': {},
                 'commands': {}}
     paths['metadata'] = paths['output'] / 'metadata.json'
 
-    # Register a metadata write whenever the program closes
-    @atexit.register
+    # Load the stage hashes recorded by the previous run
+    prev_hashes = {}
+    if args.skip_existing and paths['metadata'].exists():
+        prev_meta = orjson.loads(paths['metadata'].read_bytes())
+        prev_hashes = prev_meta.get('stage_hashes', {})
+    metadata['stage_hashes'] = {}
+
+    # A stage is up-to-date if its hash matches the previous run and its
+    # output exists. Once a stage runs, every following stage runs too.
+    rerun = not args.skip_existing
+
+    def up_to_date(stage: str, key: str, output: Path) -> bool:
+        nonlocal rerun
+        if prev_hashes.get(stage) != key or not output.exists():
+            rerun = True
+        if not rerun:
+            logger.info('Skipping up-to-date stage: %s', stage)
+        return not rerun
+
+    # Write metadata at start and whenever the pipeline exits
     def write_metadata():
+        # paths gains entries as stages run, so refresh it on every write
         metadata['paths'] = {key: str(val) for key, val in paths.items()}
         metadata['commands'][current_timestamp()] = "Writing metadata"
-        with paths['metadata'].open('w') as meta_file:
-            meta_file.write(json.dumps(metadata, indent=4, sort_keys=False))
+        paths['metadata'].write_bytes(
+            orjson.dumps(metadata, option=orjson.OPT_INDENT_2))
 
     # Write metadata once
     write_metadata()
 
-    # Initialize the mvg project
-    logger.info('Importing dataset')
-    if args.import_pgs_scan:
-        init_sfm_pgs(paths,
-                     pairs_file_radius=args.matching_pairs_radius,
-                     metadata=metadata)
-    elif args.new_importer:
-        init_sfm_generic2(paths['input'].resolve(),
-                          sfm_file=paths['sfm'],
-                          camdb_path=paths['CAM_DB'])
-    else:
-        init_sfm_generic(paths, focal_length=args.focal_length,
-                         metadata=metadata)
-
-    # Compute features
-    logger.info('Computing image features')
-    compute_features(paths, method=args.describer_method,
-                     preset=args.describer_preset,
-                     upright=args.describer_upright,
-                     metadata=metadata, threads=args.threads)
-
-    # Match features/Compute Structure
-    logger.info('Matching image features')
-    pairs_file = args.matching_pairs_file
-    if pairs_file.lower() == 'none':
-        pairs_file = None
-    elif pairs_file.lower() == 'auto':
+    try:
+        # Initialize the mvg project
+        logger.info('Importing dataset')
         if args.import_pgs_scan:
-            pairs_file = paths.get('view_pairs', None)
+            init_sfm_pgs(paths,
+                         pairs_file_radius=args.matching_pairs_radius,
+                         metadata=metadata)
+        elif args.new_importer:
+            init_sfm_generic2(paths['input'],
+                              sfm_file=paths['sfm'],
+                              camdb_path=paths['CAM_DB'])
         else:
+            init_sfm_generic(paths, focal_length=args.focal_length,
+                             metadata=metadata)
+
+        # Hash the dataset import inputs
+        key = stage_hash('', 'import', input=file_fingerprint(paths['input']),
+                         calib=file_fingerprint(paths['input_calib'])
+                         if 'input_calib' in paths else None,
+                         cam_db=paths['CAM_DB'], pgs=args.import_pgs_scan,
+                         new_importer=args.new_importer,
+                         focal_length=args.focal_length,
+                         radius=args.matching_pairs_radius)
+
+        # Compute features
+        key = stage_hash(key, 'features', method=args.describer_method,
+                         preset=args.describer_preset,
+                         upright=args.describer_upright)
+        if not up_to_date('features', key,
+                          paths['matches_dir'] / 'image_describer.json'):
+            logger.info('Computing image features')
+            if args.describer_method.startswith('AKAZE') and args.threads < 4:
+                logger.warning('AKAZE feature extraction is very slow with '
+                               'only %d thread(s)', args.threads)
+            compute_features(paths, method=args.describer_method,
+                             preset=args.describer_preset,
+                             upright=args.describer_upright,
+                             metadata=metadata, threads=args.threads)
+        metadata['stage_hashes']['features'] = key
+
+        # Match features/Compute Structure
+        pairs_file = args.matching_pairs_file
+        if pairs_file.lower() == 'none':
             pairs_file = None
-    paths['view_pairs'] = pairs_file
-    compute_matches(paths, method=args.matching_method,
-                    ratio=args.matching_ratio, pairs_file=pairs_file,
-                    metadata=metadata)
-
-    # Filter matches
-    logger.info('Filtering image features')
-    geometric_filter(paths, model=args.matching_geometric_model, metadata=metadata)
-
-    # MVG scene computation
-    if args.mvg_recon_method == 'direct':
-        logger.info('Computing structure from known poses')
-        sfm_key = mvg_compute_known(paths, sfm_key='sfm', direct=True,
-                                    bundle_adjustment=args.sfm_ba,
-                                    metadata=metadata)
-    else:
-        logger.info(f'Running SfM (Engine: {args.mvg_recon_method}')
-        sfm_key = mvg_sfm(paths, sfm_key='sfm', engine=args.mvg_recon_method,
-                          use_priors=args.mvg_priors,
-                          refine_intrinsics=args.mvg_refine_intrinsics,
-                          initializer=args.mvg_initializer,
-                          metadata=metadata)
-
-    # Robust SfM
-    if args.mvg_robust:
-        logger.info('Performing robust triangulation')
-        sfm_key = mvg_compute_known(paths, sfm_key=sfm_key,
-                                    bundle_adjustment=args.robust_ba,
-                                    metadata=metadata)
-        
-    if args.mvg_autoscale is not None:
-        logger.info('Auto-scaling SfM scene')
-        sfm_key = mvg_autoscale(paths=paths,
-                                sfm_key=sfm_key,
-                                marker_size=args.mvg_autoscale,
-                                detection_method=args.autoscale_method,
-                                marker_pix=args.autoscale_marker_pix,
-                                include_from=args.autoscale_include_from,
-                                exclude_from=args.autoscale_exclude_from)
-            
-    logger.info('Colorizing SfM scene')
-    mvg_colorize_sfm(paths, sfm_key=sfm_key, metadata=metadata)
-
-    # Exit early
-    if not args.mvs:
+        elif pairs_file.lower() == 'auto':
+            if args.import_pgs_scan:
+                pairs_file = paths.get('view_pairs', None)
+            else:
+                pairs_file = None
+        paths['view_pairs'] = pairs_file
+        key = stage_hash(key, 'matches', method=args.matching_method,
+                         ratio=args.matching_ratio, pairs_file=pairs_file)
+        if not up_to_date('matches', key, paths['matches_file']):
+            logger.info('Matching image features')
+            compute_matches(paths, method=args.matching_method,
+                            ratio=args.matching_ratio, pairs_file=pairs_file,
+                            metadata=metadata)
+        metadata['stage_hashes']['matches'] = key
+
+        # Filter matches. Direct reconstruction triangulates from the
+        # putative matches, so it never reads the filtered matches.
+        key = stage_hash(key, 'filter', model=args.matching_geometric_model)
+        filtered = paths['matches_dir'] / 'matches_filtered.bin'
+        if (args.mvg_recon_method == 'direct'
+                and not args.force_geometric_filter):
+            logger.info('Skipping geometric filtering for direct '
+                        'reconstruction')
+        else:
+            if up_to_date('filter', key, filtered):
+                paths['matches_file_filtered'] = filtered
+            else:
+                logger.info('Filtering image features')
+                geometric_filter(paths, model=args.matching_geometric_model,
+                                 metadata=metadata)
+            # Only record the hash when the filtered matches are current
+            metadata['stage_hashes']['filter'] = key
+
+        # MVG scene computation
+        key = stage_hash(key, 'sfm', engine=args.mvg_recon_method,
+                         ba=args.sfm_ba, priors=args.mvg_priors,
+                         refine_intrinsics=args.mvg_refine_intrinsics,
+                         initializer=args.mvg_initializer)
+        if args.mvg_recon_method == 'direct':
+            sfm_key = 'sfm_structured'
+            sfm_path = paths['recon_dir'] / 'sfm_data_structured.bin'
+        else:
+            sfm_key = 'sfm_recon'
+            sfm_path = paths['recon_dir'] / 'sfm_data.bin'
+        if up_to_date('sfm', key, sfm_path):
+            paths[sfm_key] = sfm_path
+        elif args.mvg_recon_method == 'direct':
+            logger.info('Computing structure from known poses')
+            sfm_key = mvg_compute_known(paths, sfm_key='sfm', direct=True,
+                                        bundle_adjustment=args.sfm_ba,
+                                        metadata=metadata)
+        else:
+            logger.info('Running SfM (Engine: %s)', args.mvg_recon_method)
+            sfm_key = mvg_sfm(paths, sfm_key='sfm',
+                              engine=args.mvg_recon_method,
+                              use_priors=args.mvg_priors,
+                              refine_intrinsics=args.mvg_refine_intrinsics,
+                              initializer=args.mvg_initializer,
+                              metadata=metadata)
+        metadata['stage_hashes']['sfm'] = key
+
+        # Robust SfM
+        if args.mvg_robust:
+            logger.info('Performing robust triangulation')
+            sfm_key = mvg_compute_known(paths, sfm_key=sfm_key,
+                                        bundle_adjustment=args.robust_ba,
+                                        metadata=metadata)
+
+        if args.mvg_autoscale is not None:
+            logger.info('Auto-scaling SfM scene')
+            sfm_key = mvg_autoscale(paths=paths,
+                                    sfm_key=sfm_key,
+                                    marker_size=args.mvg_autoscale,
+                                    detection_method=args.autoscale_method,
+                                    marker_pix=args.autoscale_marker_pix,
+                                    include_from=args.autoscale_include_from,
+                                    exclude_from=args.autoscale_exclude_from)
+
+        logger.info('Colorizing SfM scene')
+        mvg_colorize_sfm(paths, sfm_key=sfm_key, metadata=metadata)
+
+        # Exit early
+        if not args.mvs:
+            current_time = current_timestamp()
+            metadata['commands'][current_time] = "Processing complete"
+            logger.info('Processing complete. Results saved to: %s',
+                        paths['output'])
+            return
+
+        # Convert MVG -> MVS
+        logger.info('Converting MVG scene to MVS scene')
+        mvs_key = mvg_to_mvs(paths, sfm_key=sfm_key, metadata=metadata,
+                             threads=args.threads)
+
+        # Densify MVS Scene
+        if args.mvs_densify:
+            logger.info('Densifying point cloud')
+            mvs_key = mvs_densify(paths, mvs_key=mvs_key,
+                                  resolution_lvl=args.densify_resolution_level,
+                                  mask_value=args.mask_value,
+                                  metadata=metadata)
+
+        # Reconstruct Scene Mesh
+        logger.info('Reconstructing mesh')
+        mvs_key, mesh_key = mvs_reconstruct(paths, mvs_key=mvs_key,
+                                            free_space=args.free_space_support,
+                                            smooth=args.mvs_smooth,
+                                            metadata=metadata)
+
+        # Refine Mesh
+        logger.info('Refining mesh')
+        if args.mvs_refine:
+            mvs_key, mesh_key = mvs_refine(
+                paths, mvs_key=mvs_key, mesh_key=mesh_key,
+                decimation_factor=args.decimation_factor,
+                resolution_lvl=args.refine_resolution_level,
+                min_resolution=args.refine_min_resolution,
+                scales=args.refine_scales,
+                scale_step=args.refine_scale_step,
+                metadata=metadata)
+
+        # Texture Mesh
+        logger.info('Texturing mesh')
+        mvs_texture(paths, mvs_key=mvs_key, mesh_key=mesh_key,
+                    file_format=args.file_type,
+                    resolution_lvl=args.texture_resolution_level,
+                    max_size=args.texture_max_size,
+                    metadata=metadata, output_name=args.name)
+
+        # Add final timestamp
         current_time = current_timestamp()
         metadata['commands'][current_time] = "Processing complete"
-        logger.info(f'Processing complete. Results saved to: {paths["output"]}')
-        return
-
-    # Convert MVG -> MVS
-    logger.info('Converting MVG scene to MVS scene')
-    mvs_key = mvg_to_mvs(paths, sfm_key=sfm_key, metadata=metadata,
-                         threads=args.threads)
-
-    # Densify MVS Scene
-    if args.mvs_densify:
-        logger.info('Densifying point cloud')
-        mvs_key = mvs_densify(paths, mvs_key=mvs_key,
-                              resolution_lvl=args.densify_resolution_level,
-                              mask_value=args.mask_value,
-                              metadata=metadata)
-
-    # Reconstruct Scene Mesh
-    logger.info('Reconstructing mesh')
-    mvs_key, mesh_key = mvs_reconstruct(paths, mvs_key=mvs_key,
-                              free_space=args.free_space_support,
-                              smooth=args.mvs_smooth,
-                              metadata=metadata)
-
-    # Refine Mesh
-    logger.info('Refining mesh')
-    if args.mvs_refine:
-        mvs_key, mesh_key = mvs_refine(paths, mvs_key=mvs_key,
-                                       mesh_key=mesh_key,
-                                       decimation_factor=args.decimation_factor,
-                                       resolution_lvl=args.refine_resolution_level,
-                                       min_resolution=args.refine_min_resolution,
-                                       scales=args.refine_scales,
-                                       scale_step=args.refine_scale_step,
-                                       metadata=metadata)
-
-    # Texture Mesh
-    logger.info('Texturing mesh')
-    mvs_texture(paths, mvs_key=mvs_key, mesh_key=mesh_key,
-                file_format=args.file_type,
-                resolution_lvl=args.texture_resolution_level,
-                max_size=args.texture_max_size,
-                metadata=metadata, output_name=args.name)
-
-    # Add final timestamp
-    current_time = current_timestamp()
-    metadata['commands'][current_time] = "Processing complete"
-    logger.info(f'Processing complete. Results saved to: {paths["output"]}')
+        logger.info('Processing complete. Results saved to: %s',
+                    paths['output'])
+    finally:
+        write_metadata()
 
 
 if __name__ == '__main__':
@@ -39,6 +39,8 @@ def main():
     print('Loading mesh...')
     obj = wobj.load_obj(args.input_file)
     mesh = geom.wavefront_to_mesh(obj)
+    # Release the list geometry. mesh_to_wavefront() replaces it before saving.
+    obj.vertices, obj.polygons, obj.normals, obj.texcoords = [], [], [], []
 
     if args.scale is not None:
         print('Scaling mesh...')
@@ -48,6 +48,7 @@ import atexit
 import json
 import logging
 import re
+import shlex
 import shutil
 import sys
 from datetime import datetime as dt, timezone as tz
@@ -418,7 +419,7 @@ def sfm_to_json(sfm_path: Path, out_json: Path, bin_dir: Path,
         '-V', '-I', '-E',
     ]
     if metadata is not None:
-        metadata['commands'][current_timestamp()] = ' '.join(command)
+        metadata['commands'][current_timestamp()] = shlex.join(command)
     run_command(command)
     return out_json
 
@@ -640,7 +641,7 @@ def resolve_recon_inputs(recon_dir: Path):
     sfm_name = None
     for cmd in meta.get('commands', {}).values():
         if 'openMVG2openMVS' in cmd:
-            toks = cmd.split()
+            toks = shlex.split(cmd)
             if '-i' in toks:
                 sfm_name = Path(toks[toks.index('-i') + 1]).name
     if sfm_name is None:
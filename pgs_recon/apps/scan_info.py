@@ -1,15 +1,28 @@
 import argparse
-import json
+import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime as dt
 from pathlib import Path
 from typing import Dict, Tuple
 
+import orjson
+
 from pgs_recon.apps.list_complete import scan_is_complete
 from pgs_recon.utils.apps import ANSICode
 
 DATETIME_FMT = '%m/%d/%Y, %H:%M:%S (%Z)'
 
 
+def parse_datetime(s: str) -> dt:
+    """Parse a DATETIME_FMT timestamp. Zero-padded timestamps are sliced
+    directly, which is much faster than strptime. The time zone is ignored."""
+    try:
+        return dt(int(s[6:10]), int(s[0:2]), int(s[3:5]),
+                  int(s[12:14]), int(s[15:17]), int(s[18:20]))
+    except ValueError:
+        return dt.strptime(s, DATETIME_FMT)
+
+
 def get_by_path(data, key_list):
     """Get a nested dictionary entry from its key path"""
     for key in key_list:
@@ -27,7 +40,30 @@ def parse_filter(filter_str: str):
     return key, value
 
 
-def get_notes(scan_dir: Path) -> Tuple[Dict, Dict]:
+def cache_path() -> Path:
+    cache_dir = os.environ.get('XDG_CACHE_HOME') or Path.home() / '.cache'
+    return Path(cache_dir) / 'pgs-recon' / 'scan_info.json'
+
+
+def load_cache(path: Path) -> Dict:
+    try:
+        return orjson.loads(path.read_bytes())
+    except (OSError, orjson.JSONDecodeError):
+        return {}
+
+
+def save_cache(path: Path, cache: Dict):
+    # Write to a temp file first so concurrent runs never see a partial cache
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f'{path.name}.{os.getpid()}.tmp')
+    tmp.write_bytes(orjson.dumps(cache))
+    os.replace(tmp, path)
+
+
+def get_notes(scan_dir: Path, cache: Dict = None) -> Tuple[Dict, Dict]:
+    """Returns (info, metadata). If a cache dict is provided, info is reused
+    from it when neither metadata.json nor the scan directory have changed. On
+    a cache hit, the returned metadata is empty."""
     info = {
         'software': '',
         'scanner': 'Unknown',
@@ -40,47 +76,61 @@ def get_notes(scan_dir: Path) -> Tuple[Dict, Dict]:
 
     # Check if we have a metadata file
     meta_path = scan_dir / 'metadata.json'
-    if not meta_path.exists():
+    try:
+        meta_stat = meta_path.stat()
+    except OSError:
         return info, {}
 
+    # Check the cache. The directory mtime tracks added/removed images.
+    if cache is not None:
+        cache_key = str(scan_dir.absolute())
+        stamp = [meta_stat.st_mtime_ns, meta_stat.st_size,
+                 scan_dir.stat().st_mtime_ns]
+        entry = cache.get(cache_key)
+        if entry is not None and entry[0] == stamp:
+            return entry[1], {}
+
     # Load the metadata
-    with meta_path.open() as f:
-        meta = json.loads(f.read())
+    meta = orjson.loads(meta_path.read_bytes())
 
     # Get software and scanner info
     info['software'] = meta['software']
-    if 'scanner' in meta.keys():
+    if 'scanner' in meta:
         hw = meta["scanner"]
         info['scanner'] = f'{hw["make"]} {hw["model"]} ({hw.get("sn", "")})'
 
     # Get scan info
-    if 'scan' in meta.keys():
+    if 'scan' in meta:
         scan = meta['scan']
         info['complete'] = scan_is_complete(scan_dir, meta=meta)
-        if 'capture_settings' in scan.keys():
+        if 'capture_settings' in scan:
             info['num_captures'] = len(scan['capture_settings'])
-        if 'capture_positions' in scan.keys():
+        if 'capture_positions' in scan:
             info['num_positions'] = len(scan['capture_positions'])
-        if 'datetime_start' in scan.keys() and 'datetime_end' in scan.keys():
-            start_time = scan['datetime_start']
-            end_time = scan['datetime_end']
-            if len(start_time) > 0 and len(end_time) > 0:
-                start_time = dt.strptime(start_time, DATETIME_FMT)
-                end_time = dt.strptime(end_time, DATETIME_FMT)
-                info['duration'] = str(end_time - start_time)
+        start_time = scan.get('datetime_start')
+        end_time = scan.get('datetime_end')
+        if start_time and end_time:
+            start_time = parse_datetime(start_time)
+            end_time = parse_datetime(end_time)
+            info['duration'] = str(end_time - start_time)
 
     # Get sample info
-    if 'sample' in meta.keys() and 'Notes' in meta['sample'].keys():
+    if 'Notes' in meta.get('sample', {}):
         info['notes'] = meta['sample']['Notes']
 
+    if cache is not None:
+        cache[cache_key] = [stamp, info]
     return info, meta
 
 
-def print_dir(dir_path, detail_level, status_filter, meta_filter=None) -> Tuple[
-    bool, bool]:
-    """Returns (is complete, passed meta filter)"""
+def print_dir(dir_path, detail_level, status_filter, meta_filter=None,
+              cache=None, notes=None) -> Tuple[bool, bool]:
+    """Returns (is complete, passed meta filter). If notes is provided, it
+    should be the result of get_notes(dir_path)."""
     # Get info
-    info, meta = get_notes(dir_path)
+    if notes is None:
+        notes = get_notes(dir_path, cache=cache)
+    info, meta = notes
 
     # Filter by metadata filter first
     if meta_filter is not None:
@@ -133,14 +183,32 @@ def main():
                              '\'--filter scanner/sn=G01-001\' will return all '
                              'scans captured on the scanner with serial no. '
                              'G01-001. Supported operators: =')
+    parser.add_argument('--sort', default='name', type=str.lower,
+                        choices=['name', 'inode'],
+                        help='Order in which scans are read and printed. '
+                             '\'inode\' can reduce disk seeks on HDD and NFS '
+                             'storage.')
+    parser.add_argument('--cache', action='store_true',
+                        help='Cache scan info in $XDG_CACHE_HOME/pgs-recon '
+                             'between runs. Entries are refreshed when a '
+                             'scan\'s metadata.json or directory listing '
+                             'changes. Has no effect with --filter.')
     args = parser.parse_args()
+    sort_key = (lambda e: e.name) if args.sort == 'name' else os.DirEntry.inode
 
     # Parse the metadata filter
     meta_filter = None
     if args.filter is not None:
         meta_filter = parse_filter(args.filter)
 
+    # Load the scan info cache. Cached entries don't keep the full metadata, so
+    # the cache is bypassed when filtering on it.
+    cache = None
+    if args.cache and meta_filter is None:
+        cache = load_cache(cache_path())
+
     # Iterate over inputs
+    seen = set()
     complete = 0
     incomplete = 0
     skipped = 0
@@ -148,7 +216,9 @@ def main():
         input_dir = Path(input_dir)
         # Handle input which is scan directory
         if (input_dir / 'metadata.json').exists():
-            c, p = print_dir(input_dir, args.detail, args.print, meta_filter)
+            seen.add(str(input_dir.absolute()))
+            c, p = print_dir(input_dir, args.detail, args.print, meta_filter,
+                             cache)
             if not p:
                 skipped += 1
                 continue
@@ -158,10 +228,19 @@ def main():
                 incomplete += 1
         # Handle directory of scans
         else:
-            for d in sorted(list(input_dir.iterdir())):
-                if not d.is_dir():
-                    continue
-                c, p = print_dir(d, args.detail, args.status, meta_filter)
+            with os.scandir(input_dir) as it:
+                entries = sorted((e for e in it if e.is_dir()), key=sort_key)
+            dirs = [Path(e.path) for e in entries]
+            seen.update(str(d.absolute()) for d in dirs)
+
+            # Load scan info in parallel to overlap filesystem latency. map()
+            # keeps the results in directory order for printing.
+            with ThreadPoolExecutor() as ex:
+                all_notes = ex.map(lambda d: get_notes(d, cache=cache), dirs)
+                all_notes = list(all_notes)
+            for d, notes in zip(dirs, all_notes):
+                c, p = print_dir(d, args.detail, args.status, meta_filter,
+                                 notes=notes)
                 if not p:
                     skipped += 1
                     continue
@@ -169,6 +248,11 @@ def main():
                     complete += 1
                 else:
                     incomplete += 1
+    # Save the cache, dropping scans which weren't seen in this run
+    if cache is not None:
+        cache = {k: v for k, v in cache.items() if k in seen}
+        save_cache(cache_path(), cache)
+
     total = complete + incomplete
     print(
         f'{ANSICode.BOLD}Processed {total} scans ({skipped} skipped):{ANSICode.ENDC} '
@@ -1,8 +1,9 @@
+import shlex
 from enum import IntEnum
 from pathlib import Path
 from typing import Dict
 
-from pgs_recon.utility import current_timestamp, run_command
+from pgs_recon.utility import available_cpus, current_timestamp, run_command
 
 
 class CameraModel(IntEnum):
@@ -24,6 +25,15 @@ class ResectionMethod(IntEnum):
     UP2P = 5
 
 
+# Default HNSW matcher for each describer's descriptor type: L1 for uint8 SIFT,
+# L2 for float AKAZE, and Hamming for binary AKAZE (MLDB)
+HNSW_MATCHING_METHODS = {
+    'SIFT': 'HNSWL1',
+    'AKAZE_FLOAT': 'HNSWL2',
+    'AKAZE_MLDB': 'HNSWHAMMING',
+}
+
+
 def init_sfm_generic(paths: Dict[str, Path], focal_length=None,
                      metadata: Dict = None):
     """Init sfm scene from dir of images"""
@@ -36,7 +46,7 @@ def init_sfm_generic(paths: Dict[str, Path], focal_length=None,
     if focal_length is not None:
         command.extend(['-f', str(focal_length)])
     if metadata is not None:
-        metadata['commands'][current_timestamp()] = (str(' ').join(command))
+        metadata['commands'][current_timestamp()] = shlex.join(command)
     run_command(command)
 
 
@@ -45,19 +55,20 @@ def compute_features(paths: Dict[str, Path], method: str, preset: str,
                      metadata: Dict = None):
     """MVG: Compute image features"""
     # Compute features
+    if threads is None:
+        threads = available_cpus()
     command = [
         str(paths['BIN'] / 'openMVG_main_ComputeFeatures'),
         '-i', str(paths['sfm']),
         '-o', str(paths['matches_dir']),
         '-m', method,
         '-p', preset,
+        '-n', str(threads),
     ]
     if upright:
         command.extend(['-u', '1'])
-    if threads is not None:
-        command.extend(['-n', str(threads)])
     if metadata is not None:
-        metadata['commands'][current_timestamp()] = (str(' ').join(command))
+        metadata['commands'][current_timestamp()] = shlex.join(command)
     run_command(command)
 
 
@@ -76,7 +87,7 @@ def compute_matches(paths: Dict[str, Path], method: str,
     if pairs_file is not None:
         command.extend(['-p', str(pairs_file)])
     if metadata is not None:
-        metadata['commands'][current_timestamp()] = (str(' ').join(command))
+        metadata['commands'][current_timestamp()] = shlex.join(command)
     run_command(command)
 
 
@@ -96,7 +107,7 @@ def geometric_filter(paths: Dict[str, Path], model: str = None,
     if pairs_file is not None:
         command.extend(['-p', str(pairs_file)])
     if metadata is not None:
-        metadata['commands'][current_timestamp()] = (str(' ').join(command))
+        metadata['commands'][current_timestamp()] = shlex.join(command)
     run_command(command)
 
 
@@ -122,7 +133,7 @@ def mvg_sfm(paths: Dict[str, Path], sfm_key: str, engine: str, use_priors=False,
     if initializer is not None:
         command.extend(['-S', initializer])
     if metadata is not None:
-        metadata['commands'][current_timestamp()] = (str(' ').join(command))
+        metadata['commands'][current_timestamp()] = shlex.join(command)
     run_command(command)
     paths['sfm_recon'] = paths['recon_dir'] / 'sfm_data.bin'
     return 'sfm_recon'
@@ -152,7 +163,7 @@ def mvg_autoscale(paths: Dict[str, Path], sfm_key: str, marker_size: float,
     if exclude_from is not None:
         command.extend(['--exclude-from', str(exclude_from)])
     if metadata is not None:
-        metadata['commands'][current_timestamp()] = (str(' ').join(command))
+        metadata['commands'][current_timestamp()] = shlex.join(command)
     run_command(command)
     return out_key
 
@@ -176,7 +187,7 @@ def mvg_compute_known(paths: Dict[str, Path], sfm_key: str,
     if bundle_adjustment:
         command.append('-b')
     if metadata is not None:
-        metadata['commands'][current_timestamp()] = (str(' ').join(command))
+        metadata['commands'][current_timestamp()] = shlex.join(command)
     run_command(command)
     return out_key
 
@@ -194,7 +205,7 @@ def mvg_colorize_sfm(paths: Dict[str, Path], sfm_key: str,
         '-o', str(paths[sfm_colorized_key]),
     ]
     if metadata is not None:
-        metadata['commands'][current_timestamp()] = (str(' ').join(command))
+        metadata['commands'][current_timestamp()] = shlex.join(command)
     run_command(command)
     return sfm_colorized_key
 
@@ -240,7 +251,7 @@ def mvg_localize(paths: Dict[str, Path], sfm_key: str, query_key: str,
     if threads is not None:
         command.extend(['-n', str(threads)])
     if metadata is not None:
-        metadata['commands'][current_timestamp()] = (str(' ').join(command))
+        metadata['commands'][current_timestamp()] = shlex.join(command)
     run_command(command)
     paths['sfm_expanded'] = paths[out_key] / 'sfm_data_expanded.json'
     return 'sfm_expanded'
@@ -258,6 +269,6 @@ def mvg_to_mvs(paths: Dict[str, Path], sfm_key: str, threads: int = None,
     if threads is not None:
         command.extend(['-n', str(threads)])
     if metadata is not None:
-        metadata['commands'][current_timestamp()] = (str(' ').join(command))
+        metadata['commands'][current_timestamp()] = shlex.join(command)
     run_command(command, cwd=paths['mvs'])
     return 'mvs_scene'
@@ -1,3 +1,4 @@
+import shlex
 from pathlib import Path
 from typing import Dict, Tuple
 
@@ -22,7 +23,7 @@ def mvs_densify(paths: Dict[str, Path], mvs_key: str,
     if mask_value is not None:
         command.extend(['--ignore-mask-label', str(mask_value)])
     if metadata is not None:
-        metadata['commands'][current_timestamp()] = (str(' ').join(command))
+        metadata['commands'][current_timestamp()] = shlex.join(command)
     run_command(command)
     return out_key
 
@@ -44,7 +45,7 @@ def mvs_reconstruct(paths: Dict[str, Path], mvs_key: str, free_space=False,
     if free_space:
         command.extend(['--free-space-support', '1'])
     if metadata is not None:
-        metadata['commands'][current_timestamp()] = (str(' ').join(command))
+        metadata['commands'][current_timestamp()] = shlex.join(command)
     run_command(command)
     return scene_key, mesh_key
 
@@ -76,7 +77,7 @@ def mvs_refine(paths: Dict[str, Path], mvs_key: str, mesh_key: str,
     if scale_step is not None:
         command.extend(['--scale-step', str(scale_step)])
     if metadata is not None:
-        metadata['commands'][current_timestamp()] = (str(' ').join(command))
+        metadata['commands'][current_timestamp()] = shlex.join(command)
     run_command(command)
     return mvs_key, out_key
 
@@ -125,6 +126,6 @@ def mvs_texture(paths: Dict[str, Path], mvs_key: str, mesh_key: str,
     if local_seam_leveling is not None:
         command.extend(['--local-seam-leveling', str(local_seam_leveling)])
     if metadata is not None:
-        metadata['commands'][current_timestamp()] = (str(' ').join(command))
+        metadata['commands'][current_timestamp()] = shlex.join(command)
     run_command(command, cwd=paths['mvs'])
     return out_key
@@ -16,11 +16,17 @@ from sfm_utils.openmvg import __OPENMVG_CAMDB_DEFAULT_PATH
 from pgs_recon.utility import current_timestamp
 
 
+# Image dimension tags in order of preference
+WIDTH_TAGS = ('File:ImageWidth', 'EXIF:ImageWidth')
+HEIGHT_TAGS = ('File:ImageHeight', 'EXIF:ImageHeight')
+
+
 def get_tag_option(tags, opts):
     """Return the value of the first key in `opts` that is present in `tags`"""
     for o in opts:
-        if o in tags.keys():
-            return tags[o]
+        val = tags.get(o)
+        if val is not None:
+            return val
     raise KeyError(f'key option not found: {opts}')
 
 
@@ -68,10 +74,13 @@ def neighbor_lookup_gridscan(scan_meta):
                 lut[d, r, c] = pos
                 pos += 1
 
+    # Reverse lookup from position index to its XY grid cell
+    grid_yx = {int(pos): (y, x) for (_, y, x), pos in np.ndenumerate(lut)}
+
     # Neighbor lookup function
     def get_neighbors(pos_idx, radius):
         # Only search in XY
-        _, y, x = [a.item() for a in np.where(lut == pos_idx)]
+        y, x = grid_yx[pos_idx]
         ly, hy = max(0, y - radius), min(rows, y + radius + 1)
         lx, hx = max(0, x - radius), min(cols, x + radius + 1)
         n = lut[:, ly:hy, lx:hx].flatten()
@@ -134,8 +143,8 @@ def import_pgs_scan(scan_dir: Path, cam_db: dict,
         # Setup view
         view = sfm.View()
         view.path = img
-        view.width = get_tag_option(tags, ['File:ImageWidth', 'EXIF:ImageWidth'])
-        view.height = get_tag_option(tags, ['File:ImageHeight', 'EXIF:ImageHeight'])
+        view.width = get_tag_option(tags, WIDTH_TAGS)
+        view.height = get_tag_option(tags, HEIGHT_TAGS)
         view.make = tags['EXIF:Make']
         view.model = tags['EXIF:Model']
 
@@ -170,14 +179,14 @@ def import_pgs_scan(scan_dir: Path, cam_db: dict,
         intrinsic.width = view.width
         intrinsic.height = view.height
         intrinsic.focal_length = tags['EXIF:FocalLength']
-        if f'{view.make} {view.model}' in cam_db.keys():
-            intrinsic.sensor_width = cam_db[f'{view.make} {view.model}']
-        elif f'{view.model}' in cam_db.keys():
-            intrinsic.sensor_width = cam_db[f'{view.model}']
-        else:
+        sensor_width = cam_db.get(f'{view.make} {view.model}')
+        if sensor_width is None:
+            sensor_width = cam_db.get(f'{view.model}')
+        if sensor_width is None:
             logger.warning(
                 f'Camera not in database: {view.make} {view.model}. Ignoring file: {img.name}')
             continue
+        intrinsic.sensor_width = sensor_width
 
         # Init extrinsics
         pose = sfm.Pose()
@@ -233,14 +242,12 @@ def import_pgs_scan(scan_dir: Path, cam_db: dict,
         # Calculate the view pairs this position to all neighbor positions
         for n in neighbors:
             neighbor_list = position_views.get(n, [])
-            pairs = []
             for a, b in itertools.product(view_list, neighbor_list):
                 # never compare a view with itself
                 if a == b:
                     continue
                 # smallest view ID first for set union to work
-                pairs.append((b, a) if b < a else (a, b))
-            view_pairs = view_pairs.union(pairs)
+                view_pairs.add((b, a) if b < a else (a, b))
 
     # Sort the view pairs
     view_pairs = list(view_pairs)
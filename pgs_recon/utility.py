@@ -1,3 +1,4 @@
+import os
 import subprocess
 import sys
 from datetime import datetime as dt, timezone as tz
@@ -8,9 +9,30 @@ def current_timestamp() -> str:
     return dt.now(tz.utc).strftime("%m/%d/%Y, %H:%M:%S.%f %Z")
 
 
+def available_cpus() -> int:
+    """Number of CPUs this process may run on (respects CPU affinity)"""
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def cpu_has_flag(flag: str) -> bool:
+    """Check /proc/cpuinfo for a CPU feature flag (Linux only)"""
+    try:
+        with open('/proc/cpuinfo') as f:
+            for line in f:
+                if line.startswith('flags'):
+                    return flag in line.split(':', 1)[1].split()
+    except OSError:
+        pass
+    return False
+
+
 def run_command(cmd: List[str], cwd=None):
+    # Python's own fds are non-inheritable by default, so skipping close_fds
+    # is safe and lets subprocess launch with posix_spawn instead of fork
     try:
-        subprocess.run(cmd, check=True, cwd=cwd)
+        subprocess.run(cmd, check=True, cwd=cwd, close_fds=False)
     except OSError as e:
         print(f'Error: Failed to start command: {" ".join(cmd)}')
         sys.exit(f'{e.args}')
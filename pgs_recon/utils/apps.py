@@ -1,4 +1,6 @@
+import functools
 import logging
+import os
 import time
 
 
@@ -19,3 +21,12 @@ def setup_logging(level=logging.INFO):
     dt_fmt = '%Y-%m-%d %H:%M:%S %Z'
     logging.basicConfig(level=level, format=msg_fmt, datefmt=dt_fmt)
     logging.getLogger().handlers[0].formatter.converter = time.gmtime
+
+
+@functools.lru_cache(maxsize=64)
+def dir_contents(d) -> frozenset:
+    """Get the names of all entries in a directory. Results are cached, so
+    this is only suitable for tools which don't modify the directories they
+    inspect."""
+    with os.scandir(d) as it:
+        return frozenset(e.name for e in it)
@@ -3,6 +3,7 @@ from itertools import combinations
 import cv2
 import cv2.aruco as ar
 import numpy as np
+from scipy.spatial.distance import pdist
 
 import pgs_recon.utils.charuco as char
 
@@ -60,22 +61,30 @@ def kp_dist(a, b):
     return _SAMPLE_SQUARE_V1_KP_DIST_CM[a][b - a - 1]
 
 
+def kp_dists(ids):
+    """Get the distances between every pair of keypoints in ids. Pairs are
+    ordered as in itertools.combinations(ids, r=2)."""
+    return pdist(np.asarray(_SAMPLE_SQUARE_V1_KP_POS_CM)[ids])
+
+
 def kp_dir(a, b):
     """Get the direction from keypoint a to b"""
     return _SAMPLE_SQUARE_V1_KP_POS_CM[b] - _SAMPLE_SQUARE_V1_KP_POS_CM[a]
 
 
 def rotate_kp(kp, dim, rot):
+    """Rotate a keypoint or an (..., 2) array of keypoints"""
+    kp = np.asarray(kp)
     if rot == 0:
-        u = dim[1] - kp[1]
-        v = kp[0]
+        u = dim[1] - kp[..., 1]
+        v = kp[..., 0]
     elif rot == 1:
-        u = dim[0] - kp[0]
-        v = dim[1] - kp[1]
+        u = dim[0] - kp[..., 0]
+        v = dim[1] - kp[..., 1]
     else:
-        u = kp[1]
-        v = dim[0] - kp[0]
-    return np.array((u, v))
+        u = kp[..., 1]
+        v = dim[0] - kp[..., 0]
+    return np.stack((u, v), axis=-1)
 
 
 # Detect the EduceLab sample square in an image
@@ -143,8 +152,7 @@ def detect_sample_square(img):
                 for idx, c in enumerate(b.board_corners):
                     b.board_corners[idx, 0] = rotate_kp(c[0], dim, rot)
                 for idx, marker in enumerate(b.marker_corners):
-                    m = np.array([rotate_kp(c, dim, rot) for c in marker[0]])
-                    b.marker_corners[idx][0] = m
+                    b.marker_corners[idx][0] = rotate_kp(marker[0], dim, rot)
 
     return detected, boards, ppcm, kp_ids, kp_pos, flip, rotate
 
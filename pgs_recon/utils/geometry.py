@@ -2,10 +2,10 @@
 # but changed to fit this project's purposes: https://github.com/isl-org/Open3D
 
 import logging
-from collections import deque
-from typing import List, Set
 
 import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
 
 from pgs_recon.utils import wavefront as wobj
 
@@ -35,10 +35,10 @@ def mesh_to_wavefront(mesh: Mesh, obj: wobj.WavefrontOBJ = None):
     will be modified."""
     if obj is None:
         obj = wobj.WavefrontOBJ()
-    obj.vertices = [v.tolist() for v in mesh.vertices]
-    obj.polygons = [[v.tolist() for v in f] for f in mesh.faces]
-    obj.normals = [n.tolist() for n in mesh.normals]
-    obj.texcoords = [uv.tolist() for uv in mesh.uv_coords]
+    obj.vertices = mesh.vertices.tolist()
+    obj.polygons = mesh.faces.tolist()
+    obj.normals = mesh.normals.tolist()
+    obj.texcoords = mesh.uv_coords.tolist()
     obj.mtlid = mesh.mtl_ids.tolist()
 
     return obj
@@ -47,7 +47,7 @@ def mesh_to_wavefront(mesh: Mesh, obj: wobj.WavefrontOBJ = None):
 def segment_plane(mesh, dist_threshold=0.1, point_samples=3, iterations=1000,
                   prob=0.99999999, seed=None):
     class RANSACResult:
-        inliers: List[int]
+        inliers: np.ndarray
         error: float
         fitness: float
         inlier_rmse: float
@@ -82,12 +82,12 @@ def segment_plane(mesh, dist_threshold=0.1, point_samples=3, iterations=1000,
                            threshold: float):
         """Evaluate plane fit against a set of points"""
         res = RANSACResult()
-        pts = np.concatenate([pts, np.ones((pts.shape[0], 1))], axis=-1)
-        dist = np.einsum('j,ij->i', plane, pts)
-        dist = np.abs(dist)
+        dist = pts @ plane[:3]
+        dist += plane[3]
+        np.abs(dist, out=dist)
         idx = dist < threshold
         res.error = np.sum(dist[idx])
-        res.inliers = idx.nonzero()[0].tolist()
+        res.inliers = np.flatnonzero(idx)
 
         if len(res.inliers) > 0:
             res.fitness = len(res.inliers) / pts.shape[0]
@@ -135,7 +135,7 @@ def segment_plane(mesh, dist_threshold=0.1, point_samples=3, iterations=1000,
     # update the model using all inliers
     best_model = get_plane_from_points(mesh.vertices[final_result.inliers])
 
-    return best_model, final_result.inliers
+    return best_model, final_result.inliers.tolist()
 
 
 def index_to_boolean_mask(mask, shape):
@@ -222,98 +222,52 @@ def keep_triangles_by_mask(mesh: Mesh, mask):
     mesh.faces = faces
 
 
-def order_edge(a, b):
-    return min(a, b), max(a, b)
-
-
-def generate_edge_map(mesh: Mesh):
-    edge_map = {}
-
-    def add_edge(a, b, idx):
-        e = order_edge(a, b)
-        if e in edge_map.keys():
-            edge_map[e].append(idx)
-        else:
-            edge_map[e] = [idx]
-
-    for i, f in enumerate(mesh.faces[..., 0]):
-        add_edge(f[0], f[1], i)
-        add_edge(f[1], f[2], i)
-        add_edge(f[2], f[0], i)
-    return edge_map
-
-
-def get_face_area(f_id, mesh: Mesh):
-    vid0, vid1, vid2 = mesh.faces[f_id, ..., 0]
-    v0 = mesh.vertices[vid0]
-    v1 = mesh.vertices[vid1]
-    v2 = mesh.vertices[vid2]
-    a = v0 - v1
-    b = v0 - v2
-    return 0.5 * np.linalg.norm(np.cross(a, b))
+def get_face_areas(mesh: Mesh):
+    v = mesh.vertices[mesh.faces[..., 0].astype(int)]
+    a = v[:, 0] - v[:, 1]
+    b = v[:, 0] - v[:, 2]
+    return 0.5 * np.linalg.norm(np.cross(a, b), axis=-1)
 
 
 def cluster_connected_components(mesh: Mesh):
+    """Cluster faces which are connected by a shared edge. Returns the cluster
+    index for each face, and the number of faces and surface area of each
+    cluster."""
     logger = logging.getLogger(__name__)
     logger.info('Computing connected components...')
-    # Compute adjacency
+    # Build a bipartite graph between faces and their undirected edges
     logger.debug('Computing adjacency map...')
-    adjacency: List[Set[int]] = []
-    edge_map = generate_edge_map(mesh)
-    for i, f in enumerate(mesh.faces[..., 0]):
-        f_adj = set()
-        ab = edge_map[order_edge(f[0], f[1])]
-        bc = edge_map[order_edge(f[1], f[2])]
-        ca = edge_map[order_edge(f[2], f[0])]
-        adjacency.append(f_adj.union(ab, bc, ca))
-
+    faces = mesh.faces[..., 0].astype(int)
+    num_faces = faces.shape[0]
+    edges = np.sort(faces[:, [0, 1, 1, 2, 2, 0]].reshape(-1, 2), axis=-1)
+    unique_edges, edge_ids = np.unique(edges, axis=0, return_inverse=True)
+    num_nodes = num_faces + unique_edges.shape[0]
+    face_ids = np.repeat(np.arange(num_faces), 3)
+    graph = coo_matrix((np.ones(face_ids.shape[0], dtype=np.int8),
+                        (face_ids, num_faces + edge_ids.reshape(-1))),
+                       shape=(num_nodes, num_nodes)).tocsr()
+
+    # Every edge node is attached to a face, and faces have the lowest node
+    # indices, so clusters are numbered in order of their first face
     logger.debug('Clustering triangles...')
-    face_cluster = [None, ] * mesh.faces.shape[0]
-    cluster_metrics = []
-    c_idx = 0
-    for i, f in enumerate(mesh.faces[..., 0]):
-        # skip this face if its already clustered
-        if face_cluster[i] is not None:
-            continue
-
-        # setup outputs for new cluster
-        cluster_faces = []
-        area = 0.
-
-        # iterate over adjacent faces
-        queue = deque([i])
-        face_cluster[i] = c_idx
-        while queue:
-            qf_i = queue.popleft()
-            cluster_faces.append(qf_i)
-            area += get_face_area(qf_i, mesh)
-
-            for n in adjacency[qf_i]:
-                if face_cluster[n] is None:
-                    queue.append(n)
-                    face_cluster[n] = c_idx
-
-        cluster_metrics.append({'area': area, 'faces': cluster_faces})
-        c_idx += 1
+    _, labels = connected_components(graph, directed=False)
+    face_cluster = labels[:num_faces]
+    cluster_num_faces = np.bincount(face_cluster)
+    cluster_area = np.bincount(face_cluster, weights=get_face_areas(mesh))
 
-    return face_cluster, cluster_metrics
+    return face_cluster, cluster_num_faces, cluster_area
 
 
 def keep_largest_connected_component(mesh: Mesh, filter_vertices=True):
-    _, metrics = cluster_connected_components(mesh)
-    metrics = sorted(metrics, key=lambda m: m['area'], reverse=True)
-    keep_triangles_by_mask(mesh, metrics[0]['faces'])
+    face_cluster, _, cluster_area = cluster_connected_components(mesh)
+    keep_triangles_by_mask(mesh, face_cluster == np.argmax(cluster_area))
     if filter_vertices:
         remove_unreferenced_vertices(mesh)
 
 
 def remove_connected_components_by_size(mesh: Mesh, num_faces: int, filter_vertices=True):
-    _, metrics = cluster_connected_components(mesh)
-    faces = set()
-    for metric in metrics:
-        if len(metric['faces']) >= num_faces:
-            faces = faces.union(metric['faces'])
-    keep_triangles_by_mask(mesh, list(faces))
+    face_cluster, cluster_num_faces, _ = cluster_connected_components(mesh)
+    keep_triangles_by_mask(mesh, cluster_num_faces[face_cluster] >= num_faces)
     if filter_vertices:
         remove_unreferenced_vertices(mesh)
 
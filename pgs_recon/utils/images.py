@@ -0,0 +1,9 @@
+import cv2
+
+# cv2.imread flags for loading a color image at a reduced resolution
+IMREAD_REDUCED = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8
+}
@@ -1,5 +1,4 @@
 import numpy as np
-from sklearn import neighbors
 
 
 def measure_exposure(img):
@@ -26,6 +25,7 @@ def measure_exposure(img):
 
 def detect_outliers(x, clf=None, **kwargs):
     if clf is None:
+        from sklearn import neighbors
         if not kwargs:
             kwargs = {'n_neighbors': 8}
         clf = neighbors.LocalOutlierFactor(**kwargs)
@@ -45,6 +45,7 @@ def main():
     import logging
     import sys
     import json
+    from sklearn import neighbors
 
     logger = logging.getLogger('pgs-classify-outliers')
 